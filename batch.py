@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import math
+from itertools import islice
+import numpy as np
+from sudoku import Sudoku
+from topology import topology
+
+
+""" Vectorized constraint propagation over many puzzles at once.
+
+A batch is a numpy array of candidate masks of shape (B, size**2), one row
+per puzzle, with bit (v - 1) of a cell set if v is still a candidate; a
+solved cell is a mask with a single bit. propagate() applies the naked and
+hidden singles rules (see propagation.py) to every puzzle of the batch with
+array operations, so the per-cell interpreter overhead of the scalar solvers
+is paid once per batch rather than once per puzzle. Most easy and medium
+puzzles are solved outright; solve_batch() hands only the rest to Sudoku.
+
+Masks are uint16, so puzzles up to 16x16 are supported.
+"""
+
+# propagate() results per puzzle
+SOLVED = 1
+STALLED = 0
+BROKEN = -1
+
+""" cache of index and lookup tables by size, as built by _tables() """
+_batch_tables = {}
+
+
+def _tables(size):
+    # helper function; returns (peers, units, cell_units, popcount) for
+    # size: the peers of every cell, the cells of every unit, the positions
+    # of every cell in the flattened (unit, position) array of its 3 units,
+    # and the popcount of every mask
+    if size not in _batch_tables:
+        if size > 16:
+            raise ValueError("batches hold at most 16 candidates per cell")
+        topo = topology(size)
+        peers = np.array(topo.peers, dtype=np.intp)
+
+        cell_units = np.zeros((topo.cells, 3), dtype=np.intp)
+        for u in range(len(topo.units)):
+            for p in range(size):
+                i = topo.units[u][p]
+                cell_units[i, u // size] = u * size + p
+
+        popcount = np.array([bin(m).count('1') for m in range(1 << size)],
+                            dtype=np.uint8)
+        _batch_tables[size] = (peers, np.array(topo.units, dtype=np.intp),
+                               cell_units, popcount)
+    return _batch_tables[size]
+
+
+def to_masks(puzzles, size=9):
+    """ returns the batch for puzzles, a sequence (or array) of puzzle lists
+    of ints, 0 for empty cells, as given to Sudoku(). """
+    givens = np.asarray(puzzles, dtype=np.int64).reshape(-1, size**2)
+    blank = (1 << size) - 1
+    shifted = np.left_shift(1, np.maximum(givens - 1, 0))
+    return np.where(givens > 0, shifted, blank).astype(np.uint16)
+
+
+def to_values(masks, size=9):
+    """ returns the batch masks as an int array of values, with 0 for cells
+    that are not solved (i.e., have more or fewer than one candidate). """
+    popcount = _tables(size)[3]
+    values = np.zeros(masks.shape, dtype=np.int64)
+    single = popcount[masks] == 1
+    values[single] = np.log2(masks[single]).astype(np.int64) + 1
+    return values
+
+
+def propagate(masks, size=9):
+    """ applies naked and hidden singles to every puzzle of the batch masks,
+    in place, until none of them changes. Returns an array with one entry
+    per puzzle: SOLVED if every cell is solved, BROKEN if the puzzle turned
+    out to be unsolvable (a cell with no candidates, a value with no place
+    in some unit, or two cells of a unit solved with the same value), or
+    STALLED if the rules ran out before either.
+
+    Each pass is a handful of array operations over all puzzles still
+    changing; puzzles drop out of the passes as soon as they stop changing.
+    """
+    peers, units, cell_units, popcount = _tables(size)
+    all_mask = (1 << size) - 1
+    live = np.ones(len(masks), dtype=bool)
+    broken = np.zeros(len(masks), dtype=bool)
+
+    while live.any():
+        index = np.flatnonzero(live)
+        m = masks[index]
+
+        # naked singles: remove every solved value from the cell's peers
+        single = popcount[m] == 1
+        solved = np.where(single, m, 0)
+        taken = np.bitwise_or.reduce(solved[:, peers], axis=2)
+        bad = (single & (m & taken != 0)).any(axis=1)
+        new = np.where(single, m, m & ~taken)
+
+        """ hidden singles: a value with one place left in a unit goes
+        there. Scanning each unit's cells in turn, seen holds the values met
+        at least once and twice those met more than once, so seen & ~twice
+        holds the values with a single place in the unit. """
+        cells = new[:, units]
+        seen = np.zeros(cells.shape[:2], dtype=np.uint16)
+        twice = np.zeros(cells.shape[:2], dtype=np.uint16)
+        for p in range(size):
+            twice |= seen & cells[:, :, p]
+            seen |= cells[:, :, p]
+        bad |= (seen != all_mask).any(axis=1)
+        once = seen & ~twice
+        hidden = (cells & once[:, :, np.newaxis]).reshape(len(m), -1)
+        hidden = (hidden[:, cell_units[:, 0]] | hidden[:, cell_units[:, 1]]
+                  | hidden[:, cell_units[:, 2]])
+        # a cell that two values need at once is a contradiction
+        bad |= (popcount[hidden] > 1).any(axis=1)
+        new = np.where(hidden != 0, hidden, new)
+
+        bad |= (new == 0).any(axis=1)
+        changed = (new != m).any(axis=1)
+        masks[index] = new
+        broken[index[bad]] = True
+        live[index[bad | ~changed]] = False
+
+    res = np.full(len(masks), STALLED, dtype=np.int8)
+    res[(popcount[masks] == 1).all(axis=1)] = SOLVED
+    res[broken] = BROKEN
+    return res
+
+
+def solve_batch(puzzles, chunksize=4096, size=9, engine='backtrack',
+                propagation=False, cls=Sudoku):
+    """ solves many puzzles, and yields one result per puzzle, in order, as a
+    dict with keys:
+        index:          position of the puzzle in puzzles
+        solutions:      list of solutions found, as in Sudoku.solutions
+        difficulty:     as in Sudoku.difficulty
+    puzzles is any iterable of puzzle lists, as given to Sudoku(); it is
+    read chunksize puzzles at a time, and each chunk is propagated as one
+    batch. Puzzles the batch solves or finds unsolvable are done; only those
+    that stall are solved from scratch by cls, with the remaining arguments
+    as in solve_many().
+
+    Results match a scalar solve for any puzzle whose givens don't clash
+    with each other. A puzzle solved by singles alone has a unique
+    solution, and solve_all() would never branch more than once on it, so
+    its difficulty is just its number of empty cells. Givens that clash
+    are reported here, as by solve_dlx(), as having no solution; the other
+    engines only check the cells they fill, so to them a full grid with
+    clashing givens is its own solution. Such puzzles are not handed to
+    cls, since a search from a few clashing givens can take very long.
+    """
+    puzzles = iter(puzzles)
+    start = 0
+    while True:
+        chunk = list(islice(puzzles, chunksize))
+        if not chunk:
+            return
+
+        givens = np.asarray(chunk, dtype=np.int64).reshape(-1, size**2)
+        masks = to_masks(givens, size)
+        status = propagate(masks, size)
+        values = to_values(masks, size)
+        empty = (givens == 0).sum(axis=1)
+
+        for k in range(len(chunk)):
+            if status[k] == SOLVED:
+                solutions = [values[k].tolist()]
+                difficulty = int(empty[k])
+            elif status[k] == BROKEN:
+                solutions = []
+                difficulty = math.nan
+            else:
+                sudoku = cls(size=size, label=start + k, puzzle=chunk[k],
+                             engine=engine, propagation=propagation)
+                solutions = sudoku.solutions
+                difficulty = sudoku.difficulty
+            yield {'index': start + k,
+                   'solutions': solutions,
+                   'difficulty': difficulty}
+        start += len(chunk)
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from itertools import permutations, product
+import sudoku_simulations as sims
+from puzzle_io import parse_puzzle
+from simulator import measure
+from sudoku import BitmaskSudoku, Sudoku, random_grid
+from symmetry import apply_transform, canonical_form, random_transform
+from topology import SYMBOLS
+
+
+""" Benchmarks of the solvers, with results that can be saved and compared
+from one commit to the next.
+
+Timing is done by simulator.measure(), which see for the statistics each
+result holds.
+
+run_suite() measures every solver variant in VARIANTS on every puzzle of a
+fixed corpus, CORPUS, and write_json() and write_csv() save its results.
+compare() checks results against a baseline saved by write_json(), e.g. on
+an earlier commit, and reports every variant and puzzle whose throughput
+fell by more than a threshold. check_parity() checks that the string and
+bitmask engines make the same search on every puzzle of the corpus, and
+check_canonical() that symmetry.canonical_form() still gives the same form
+for equivalent puzzles, and the smallest one. Run this file to benchmark
+from the command line; e.g.,
+    python benchmark.py --json baseline.json
+and later, to exit with status 1 on any regression,
+    python benchmark.py --baseline baseline.json --tiers easy medium
+or, to exit with status 1 if the engines disagree or canonical forms are
+wrong,
+    python benchmark.py --parity
+Baselines are only comparable on the same machine.
+"""
+
+""" version of CORPUS; change it whenever CORPUS changes, so results on
+different corpora are never compared """
+CORPUS_VERSION = 1
+
+""" fixed puzzles every variant is measured on, by difficulty tier, then by
+label, as puzzle lines (see puzzle_io.py). Scores are Sudoku.difficulty.
+    easy        a few branches at most (scores up to about 250)
+    medium      scores around 1000
+    hard        hard for some solvers: AI Escargot, and 17-clue puzzles
+                that singles solve but naive backtracking does not
+    extreme     among the hardest known (scores from 17000 to 58000)
+"""
+CORPUS = {
+    'easy': {
+        'dlbeer_55': '534..8.1......2.9......76.4...5..1..1.......3..9..1...'
+                     '3.54......8.2......6.7..382',
+        'dlbeer_253': '.7.3...4.3...8.2..2.14.7...5.4....9..2.....5..1....7.'
+                      '3...9.63.2..2.3...9.6...2.8.',
+    },
+    'medium': {
+        'dlbeer_551': '37...9..68..1.3.7.........8.2..8...5187...6425...2..1.'
+                      '7.........5.6.2..72..3...61',
+        'dlbeer_451': '.4...7.9..91.8....7.39.1....1..642.....5.8.....571..6.'
+                      '...1.58.6....4.91..5.8...2.',
+        'dlbeer_953': '..3......8.946.7.22...186.......6.7...8...4...7.8.....'
+                      '..294...54.6.328.7......2..',
+    },
+    'hard': {
+        'ai_escargot': '1....7.9..3..2...8..96..5....53..9...1..8...26....4...'
+                       '3......1..4......7..7...3..',
+        'anti_brute_force': '..............3.85..1.2.......5.7.....4...1...9..'
+                            '.....5......73..2.1........4...9',
+        'seventeen': '.......1.4.........2...........5.4.7..8...3....1.9....'
+                     '3..4..2...5.1........8.6...',
+    },
+    'extreme': {
+        'easter_monster': '1.......2.9.4...5...6...7...5.9.3.......7.......85.'
+                          '.4.7.....6...3...9.8...2.....1',
+        'golden_nugget': '.......39.....1..5..3.5.8....8.9...6.7...2...1..4..'
+                         '.....9.8..5..2....6..4..7.....',
+        'inkala': '8..........36......7..9.2...5...7.......457.....1...3...'
+                  '1....68..85...1..9....4..',
+        'platinum_blonde': '.......12........3..23..4....18....5.6..7.8......'
+                           '.9.....85.....9...4.5..47...6...',
+    },
+}
+
+""" hardest tier each of the slowest variants is run on by run_suite(),
+unless asked for by name; these take seconds per medium puzzle, and hours
+on harder ones. Others are run on every tier. """
+MAX_TIER = {'solve_nonrand': 'medium', 'solve_slow': 'medium'}
+
+# fields of a result, in the order write_csv() writes them
+FIELDS = ['variant', 'tier', 'puzzle', 'runs', 'warmup', 'mean_ns', 'stdev_ns',
+          'ci_low_ns', 'ci_high_ns', 'min_ns', 'p50_ns', 'p95_ns', 'p99_ns',
+          'max_ns']
+
+
+""" Solver variants. Each takes a puzzle (a list of ints, 0 for empty cells,
+as given to Sudoku()) and returns (fn, setup) for measure(): fn solves the
+puzzle once, from scratch, when called with the arguments setup() returns.
+"""
+def _sims_variant(solver):
+    # variant for a solve function of sudoku_simulations; each call gets a
+    # copy of the initialized puzzle, since the solvers fill it in
+    def prepare(puzzle):
+        start = sims.initialize(int(math.sqrt(len(puzzle))))
+        for i in range(len(puzzle)):
+            if puzzle[i]:
+                sims.insert(SYMBOLS[puzzle[i] - 1], i, start)
+        return solver, lambda: (start[:],)
+    return prepare
+
+
+def _sudoku_variant(cls, method, propagation=False):
+    # variant for a solve method of cls; the object is built (and solved)
+    # once, untimed, and its results are cleared before each call, as
+    # solve() does
+    def prepare(puzzle):
+        sudoku = cls(size=int(math.sqrt(len(puzzle))), label='benchmark',
+                     puzzle=puzzle, engine='dlx', propagation=propagation)
+
+        def setup():
+            sudoku.solutions = []
+            sudoku.branch_factors = []
+            sudoku.eliminations = dict.fromkeys(sudoku.eliminations, 0)
+            return ()
+
+        if method == 'search':
+            return (lambda: sudoku.search().run()), setup
+        return getattr(sudoku, method), setup
+    return prepare
+
+
+VARIANTS = {
+    'solve_nonrand': _sims_variant(sims.solve_nonrand),
+    'solve_slow': _sims_variant(sims.solve_slow),
+    'solve_fast': _sims_variant(sims.solve_fast),
+    'solve_trail': _sims_variant(sims.solve_trail),
+    'solve_propagate': _sims_variant(sims.solve_propagate),
+    'Sudoku.solve_all': _sudoku_variant(Sudoku, 'solve_all'),
+    'Sudoku.solve_all+propagation': _sudoku_variant(Sudoku, 'solve_all',
+                                                    propagation=True),
+    'Sudoku.solve_trail': _sudoku_variant(Sudoku, 'solve_trail'),
+    'Sudoku.search': _sudoku_variant(Sudoku, 'search'),
+    'Sudoku.solve_dlx': _sudoku_variant(Sudoku, 'solve_dlx'),
+    'BitmaskSudoku.solve_all': _sudoku_variant(BitmaskSudoku, 'solve_all'),
+}
+
+
+def run_suite(variants=None, tiers=None, corpus=CORPUS, repeat=30,
+              warmup=2, max_time=5, gc_enabled=False, seed=0):
+    """ measures each of the named variants (every one in VARIANTS, by
+    default) on each puzzle of the named tiers of corpus (every tier, by
+    default), and yields
+    the results in turn, with keys 'variant', 'tier', and 'puzzle' added.
+    The global random is seeded with seed before each measurement, so
+    randomized solvers take the same branches from run to run. The
+    remaining arguments are passed on to measure().
+
+    Unless variants are named, those in MAX_TIER are not run on any tier
+    past theirs.
+    """
+    for name in variants or VARIANTS:
+        names = list(corpus)
+        if not variants and name in MAX_TIER:
+            names = names[:names.index(MAX_TIER[name]) + 1]
+        for tier in names:
+            if tiers is not None and tier not in tiers:
+                continue
+            for label, line in corpus[tier].items():
+                puzzle = parse_puzzle(line, math.isqrt(len(line)))
+                fn, setup = VARIANTS[name](puzzle)
+                random.seed(seed)
+                result = measure(fn, setup=setup, repeat=repeat,
+                                 warmup=warmup, max_time=max_time,
+                                 gc_enabled=gc_enabled)
+                yield {'variant': name, 'tier': tier, 'puzzle': label,
+                       **result}
+
+
+def check_parity(tiers=None, corpus=CORPUS, seeds=(0, 1, 2),
+                 engines=('backtrack', 'trail', 'iterative')):
+    """ solves every puzzle of the given tiers of corpus (default: all) with
+    Sudoku and BitmaskSudoku, with propagation on and off, on each of the
+    given engines, seeding random with each of seeds before each solve, and
+    returns a list of the mismatches: dicts with keys 'tier', 'puzzle',
+    'engine', 'propagation' and 'seed' for every solve whose solutions,
+    branch_factors, difficulty, or eliminations differ between the two. """
+    mismatches = []
+    for tier in tiers or corpus:
+        for label, line in corpus[tier].items():
+            puzzle = parse_puzzle(line, math.isqrt(len(line)))
+            size = math.isqrt(len(puzzle))
+            for engine in engines:
+                for propagation in (False, True):
+                    for seed in seeds:
+                        found = []
+                        for cls in (Sudoku, BitmaskSudoku):
+                            random.seed(seed)
+                            sudoku = cls(size=size, label=label,
+                                         puzzle=puzzle, engine=engine,
+                                         propagation=propagation)
+                            found.append((sudoku.solutions,
+                                          sudoku.branch_factors,
+                                          str(sudoku.difficulty),
+                                          sudoku.eliminations))
+                        if found[0] != found[1]:
+                            mismatches.append({'tier': tier,
+                                               'puzzle': label,
+                                               'engine': engine,
+                                               'propagation': propagation,
+                                               'seed': seed})
+    return mismatches
+
+
+def check_canonical(tiers=None, corpus=CORPUS, transforms=5, small=300,
+                    seed=0):
+    """ checks symmetry.canonical_form() and returns a list of the failures,
+    as dicts with keys 'puzzle' and 'check':
+        'invariant'     the canonical form of a random transform of the
+                        puzzle differs from the puzzle's, or its transform
+                        doesn't give it
+        'minimal'       the canonical form is not the smallest, found by
+                        trying every transform
+    Each puzzle of the given tiers of corpus (default: all), a full grid
+    and an empty one, and a 16x16 full grid and puzzle are checked for
+    invariance under the given number of transforms; small random 4x4
+    puzzles, some with clashing givens, are checked for both. 9x9 puzzles
+    have too many transforms to try them all.
+    """
+    rng = random.Random(seed)
+    puzzles = [(label, parse_puzzle(line, math.isqrt(len(line))))
+               for tier in tiers or corpus
+               for label, line in corpus[tier].items()]
+    puzzles += [('full grid', random_grid(9, rng)), ('empty', [0] * 81)]
+    grid = random_grid(16, rng)
+    puzzles += [('16x16 full grid', grid),
+                ('16x16 puzzle', [v if rng.random() < 0.4 else 0
+                                  for v in grid])]
+    for n in range(small):
+        if n % 3:
+            grid = random_grid(4, rng)
+            keep = rng.random()
+            puzzle = [v if rng.random() < keep else 0 for v in grid]
+        else:
+            puzzle = [rng.choice((0, 0, 1, 2, 3, 4)) for i in range(16)]
+        puzzles.append((f"4x4 {n}", puzzle))
+
+    failures = []
+    for label, puzzle in puzzles:
+        size = math.isqrt(len(puzzle))
+        canonical, transform = canonical_form(puzzle, size)
+        invariant = apply_transform(puzzle, transform, size) == canonical
+        for n in range(transforms):
+            other = apply_transform(puzzle, random_transform(size, rng),
+                                    size)
+            invariant &= canonical_form(other, size)[0] == canonical
+        if not invariant:
+            failures.append({'puzzle': label, 'check': 'invariant'})
+        if size == 4 and canonical != _smallest_form(puzzle, size):
+            failures.append({'puzzle': label, 'check': 'minimal'})
+    return failures
+
+
+def _smallest_form(puzzle, size):
+    # helper function for check_canonical(); the canonical form by brute
+    # force, trying every row order, column order and transposition
+    box_size = math.isqrt(size)
+    boxes = list(permutations(range(box_size)))
+    orders = [[b * box_size + i for k, b in enumerate(bands)
+               for i in within[k]]
+              for bands in boxes
+              for within in product(boxes, repeat=box_size)]
+    identity = list(range(size + 1))
+    best = None
+    for transpose in (False, True):
+        for rows in orders:
+            for cols in orders:
+                moved = apply_transform(puzzle,
+                                        (transpose, rows, cols, identity),
+                                        size)
+                labels = [0] * (size + 1)
+                label = 1
+                for v in moved:
+                    if v and not labels[v]:
+                        labels[v] = label
+                        label += 1
+                form = [labels[v] for v in moved]
+                if best is None or form < best:
+                    best = form
+    return best
+
+
+def compare(results, baseline, threshold=0.1):
+    """ returns the regressions of results against baseline, the contents of
+    a file written by write_json(), as a list of dicts with keys 'variant',
+    'tier', 'puzzle', 'baseline' and 'throughput', the solves per second of
+    each (from the mean). Results with no match in baseline are skipped.
+
+    A result has regressed if its throughput is more than threshold (a
+    fraction) below the baseline's, and the confidence intervals of the two
+    means don't overlap, so that noise alone doesn't fail the gate. Raises
+    ValueError if baseline was measured on another CORPUS_VERSION.
+    """
+    if baseline.get('corpus_version') != CORPUS_VERSION:
+        raise ValueError(f"baseline is for corpus version "
+                         f"{baseline.get('corpus_version')}, not "
+                         f"{CORPUS_VERSION}")
+
+    before = {(r['variant'], r['tier'], r['puzzle']): r
+              for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = before.get((result['variant'], result['tier'],
+                          result['puzzle']))
+        if old is None:
+            continue
+        throughput = 1e9 / result['mean_ns']
+        old_throughput = 1e9 / old['mean_ns']
+        if (throughput < old_throughput * (1 - threshold)
+            and result['ci_low_ns'] > old['ci_high_ns']):
+            regressions.append({'variant': result['variant'],
+                                'tier': result['tier'],
+                                'puzzle': result['puzzle'],
+                                'baseline': old_throughput,
+                                'throughput': throughput})
+    return regressions
+
+
+def environment():
+    """ returns a dict describing where benchmarks are being run: the
+    Python version, platform, and git commit (None outside a checkout). """
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'commit': commit,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+
+
+def format_result(result):
+    """ returns a one-line summary of result, in milliseconds. """
+    ms = {k: result[k] / 1e6 for k in FIELDS if k.endswith('_ns')}
+    return (f"{result.get('variant', '')} {result.get('tier', '')} "
+            f"{result.get('puzzle', '')}: "
+            f"{result['runs']} runs, mean {ms['mean_ns']:.3f} ms "
+            f"[{ms['ci_low_ns']:.3f}, {ms['ci_high_ns']:.3f}], "
+            f"stdev {ms['stdev_ns']:.3f} ms, p50 {ms['p50_ns']:.3f} ms, "
+            f"p95 {ms['p95_ns']:.3f} ms, p99 {ms['p99_ns']:.3f} ms")
+
+
+def read_json(path):
+    """ returns the contents of a file written by write_json(). """
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_csv(path, results):
+    """ writes results to path as CSV, one row per result. """
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def write_json(path, results, settings=None):
+    """ writes results to path as JSON, with the environment() they were
+    measured in and the given settings (e.g., the arguments of run_suite()).
+    """
+    with open(path, 'w') as f:
+        json.dump({'corpus_version': CORPUS_VERSION,
+                   'environment': environment(),
+                   'settings': settings or {},
+                   'results': list(results)}, f, indent=1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="benchmark the solvers on a fixed puzzle corpus, and "
+                    "check for regressions against a baseline")
+    parser.add_argument('variants', nargs='*',
+                        help="variants to run (default: all); any of "
+                             + ", ".join(VARIANTS))
+    parser.add_argument('--tiers', nargs='+', choices=list(CORPUS),
+                        help="tiers to run (default: all)")
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--max-time', type=float, default=5,
+                        help="seconds to time each variant on each puzzle")
+    parser.add_argument('--gc', action='store_true',
+                        help="leave the garbage collector on while timing")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="write results to this JSON file")
+    parser.add_argument('--csv', help="write results to this CSV file")
+    parser.add_argument('--baseline',
+                        help="JSON file of earlier results to compare with; "
+                             "exit with status 1 on any regression")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="fraction throughput may fall before it is a "
+                             "regression (default: 0.1)")
+    parser.add_argument('--parity', action='store_true',
+                        help="instead of timing, check that both engines "
+                             "make the same search (see check_parity()), "
+                             "and canonical forms (see check_canonical()); "
+                             "exit with status 1 on any mismatch")
+    args = parser.parse_args(argv)
+    for name in args.variants:
+        if name not in VARIANTS:
+            parser.error(f"unknown variant {name!r}")
+
+    if args.parity:
+        mismatches = check_parity(args.tiers)
+        for m in mismatches:
+            print(f"MISMATCH {m['tier']} {m['puzzle']}: {m['engine']}, "
+                  f"propagation {m['propagation']}, seed {m['seed']}")
+        print(f"{len(mismatches)} mismatch(es) between the engines")
+        failures = check_canonical(args.tiers)
+        for f in failures:
+            print(f"CANONICAL {f['puzzle']}: not {f['check']}")
+        print(f"{len(failures)} wrong canonical form(s)")
+        return 1 if mismatches or failures else 0
+
+    settings = {'repeat': args.repeat, 'warmup': args.warmup,
+                'max_time': args.max_time, 'gc_enabled': args.gc,
+                'seed': args.seed}
+    results = []
+    # read first, so a bad baseline fails before the (long) run
+    baseline = read_json(args.baseline) if args.baseline else None
+    if (baseline is not None
+        and baseline.get('corpus_version') != CORPUS_VERSION):
+        parser.error(f"{args.baseline} is for another corpus version")
+
+    for result in run_suite(args.variants, args.tiers, repeat=args.repeat,
+                            warmup=args.warmup, max_time=args.max_time,
+                            gc_enabled=args.gc, seed=args.seed):
+        print(format_result(result), flush=True)
+        results.append(result)
+
+    if args.json:
+        write_json(args.json, results, settings)
+    if args.csv:
+        write_csv(args.csv, results)
+
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for r in regressions:
+        print(f"REGRESSION {r['variant']} {r['tier']} {r['puzzle']}: "
+              f"{r['throughput']:.1f} solves/s, down from "
+              f"{r['baseline']:.1f}")
+    print(f"{len(regressions)} regression(s) against {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
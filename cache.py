@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import json
+import sqlite3
+from collections import OrderedDict
+
+
+""" Caches of solve results, for Sudoku(cache=...). Each maps a key from
+Sudoku.cache_key() to an entry, a dict with keys:
+    solutions:      list of solutions, as in Sudoku.solutions
+    count:          number of solutions found (at most 2, as in solve())
+    branch_factors: as in Sudoku.branch_factors
+    difficulty:     as in Sudoku.difficulty
+    eliminations:   as in Sudoku.eliminations; missing from entries stored
+                    by earlier versions
+Both caches evict the least recently used entry once they hold maxsize
+entries, and count their hits and misses.
+"""
+
+
+class MemoryCache:
+    """ represents an in-memory LRU cache of solve results. """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def get(self, key):
+        """ returns the entry stored under key, or None. """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return _copy(entry)
+
+
+    def put(self, key, entry):
+        """ stores entry under key, evicting the least recently used entry if
+        the cache is full. """
+        self.entries[key] = _copy(entry)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class DiskCache:
+    """ represents an on-disk LRU cache of solve results, in a sqlite
+    database at the given path, so results survive between runs and can be
+    shared by processes run one after another. """
+
+    def __init__(self, path, maxsize=10000000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS results "
+                        "(key TEXT PRIMARY KEY, entry TEXT, used INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS results_used "
+                        "ON results (used)")
+
+        # entries stored, and the access clock used to order them
+        self.count, used = self.db.execute(
+            "SELECT COUNT(*), MAX(used) FROM results").fetchone()
+        self.clock = used or 0
+        """ access clocks of entries read since the last write, by key;
+        get() only records them, and put() and close() write them, so that
+        reads never hold the database's write lock """
+        self.touched = {}
+
+
+    def __len__(self):
+        return self.count
+
+
+    def close(self):
+        self._write_touched()
+        self.db.commit()
+        self.db.close()
+
+
+    def get(self, key):
+        """ returns the entry stored under key, or None. """
+        row = self.db.execute("SELECT entry FROM results WHERE key = ?",
+                              (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.clock += 1
+        self.touched[key] = self.clock
+        return json.loads(row[0])
+
+
+    def put(self, key, entry):
+        """ stores entry under key, evicting the least recently used entries
+        if the cache is full. """
+        # eviction goes by when entries were last used, so record that first
+        self._write_touched()
+        self.clock += 1
+        stored = self.db.execute("SELECT 1 FROM results WHERE key = ?",
+                                 (key,)).fetchone()
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                        (key, json.dumps(entry), self.clock))
+        if stored is None:
+            self.count += 1
+        if self.count > self.maxsize:
+            self.db.execute("DELETE FROM results WHERE key IN (SELECT key "
+                            "FROM results ORDER BY used LIMIT ?)",
+                            (self.count - self.maxsize,))
+            self.count = self.maxsize
+        self.db.commit()
+
+
+    def _write_touched(self):
+        """ helper function for put() and close(). writes the access clocks
+        recorded by get(), in the transaction its caller commits. """
+        if self.touched:
+            self.db.executemany("UPDATE results SET used = ? WHERE key = ?",
+                                [(used, key) for key, used
+                                 in self.touched.items()])
+            self.touched = {}
+
+
+def _copy(entry):
+    # helper function; copies entry deeply enough that callers can't change
+    # what the cache holds
+    return {'solutions': [solution[:] for solution in entry['solutions']],
+            'count': entry['count'],
+            'branch_factors': entry['branch_factors'][:],
+            'difficulty': entry['difficulty'],
+            'eliminations': dict(entry.get('eliminations', {}))}
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+""" Compact binary corpus of 9x9 puzzles, for reading with numpy.memmap.
+
+A corpus file is a 16-byte header followed by fixed-width 56-byte records,
+one per puzzle:
+    cells       41 bytes: the 81 cells of the solution, two 4-bit digits per
+                byte (high nibble first), zero-padded; cells of a puzzle
+                with no unique solution hold the givens, and 0 elsewhere
+    givens      11 bytes: 81-bit mask of the cells given in the puzzle, most
+                significant bit first
+    difficulty  little-endian float32, NaN if not uniquely solvable
+Since records are fixed width, puzzle n starts at byte 16 + 56 * n, so
+open_corpus() can map a file of any size and index or slice it without
+reading or copying the rest.
+"""
+MAGIC = b'SUDOKU'
+VERSION = 1
+# puzzle size that RECORD encodes
+SIZE = 9
+HEADER_SIZE = 16
+RECORD = np.dtype([('cells', 'u1', 41),
+                   ('givens', 'u1', 11),
+                   ('difficulty', '<f4')])
+
+
+def _header(size=SIZE):
+    # helper function; magic, version, and puzzle size, padded to 16 bytes
+    return (MAGIC + bytes([VERSION, size])).ljust(HEADER_SIZE, b'\0')
+
+
+def encode(puzzle, solution=None, difficulty=np.nan):
+    """ returns a record (a numpy.void of dtype RECORD) for the given puzzle.
+    puzzle is a list of 81 ints, 0 for empty cells, as given to Sudoku();
+    solution is its unique solution, or None. """
+    cells = np.zeros(82, dtype=np.uint8)
+    cells[:81] = solution if solution is not None else puzzle
+    given = np.zeros(88, dtype=np.uint8)
+    given[:81] = [cell != 0 for cell in puzzle]
+
+    record = np.zeros((), dtype=RECORD)
+    record['cells'] = (cells[0::2] << 4) | cells[1::2]
+    record['givens'] = np.packbits(given)
+    record['difficulty'] = difficulty
+    return record
+
+
+def decode(record):
+    """ returns (puzzle, solution, difficulty) for the given record, with
+    puzzle and solution as lists of ints as in Sudoku; solution is None if
+    the puzzle has no unique solution. """
+    cells = unpack_cells(record[np.newaxis])[0]
+    given = unpack_givens(record[np.newaxis])[0]
+    difficulty = float(record['difficulty'])
+
+    puzzle = np.where(given, cells, 0).tolist()
+    if np.isnan(difficulty):
+        return puzzle, None, difficulty
+    return puzzle, cells.tolist(), difficulty
+
+
+def unpack_cells(records):
+    """ returns the cells of every record in the array records as a uint8
+    array of shape (len(records), 81). """
+    packed = records['cells']
+    cells = np.empty((len(packed), 82), dtype=np.uint8)
+    cells[:, 0::2] = packed >> 4
+    cells[:, 1::2] = packed & 0x0f
+    return cells[:, :81]
+
+
+def unpack_givens(records):
+    """ returns the givens mask of every record in the array records as a
+    bool array of shape (len(records), 81). """
+    return np.unpackbits(records['givens'], axis=1)[:, :81].astype(bool)
+
+
+def open_corpus(path, mode='r'):
+    """ maps the corpus file at path and returns its records as a numpy
+    memmap of dtype RECORD. Nothing is read until records are accessed, so
+    indexing and slicing are O(1) and copy-free. mode is as for
+    numpy.memmap ('r' or 'r+'). Raises ValueError if the file is not a
+    corpus of this version, or holds puzzles of another size. """
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        if (len(header) < HEADER_SIZE or header[:len(MAGIC)] != MAGIC
+            or header[len(MAGIC)] != VERSION):
+            raise ValueError(
+                f"{path} is not a version {VERSION} puzzle corpus")
+        size = header[len(MAGIC) + 1]
+        if size != SIZE:
+            # records of other sizes would decode silently as garbage
+            raise ValueError(f"{path} holds {size}x{size} puzzles; only "
+                             f"{SIZE}x{SIZE} corpora can be read")
+
+        if not f.read(1):
+            # no records; numpy can't map an empty region
+            return np.zeros(0, dtype=RECORD)
+
+    return np.memmap(path, dtype=RECORD, mode=mode, offset=HEADER_SIZE)
+
+
+def write_corpus(path, entries, chunksize=65536):
+    """ writes a corpus file at path from the iterable entries of
+    (puzzle, solution, difficulty) tuples (see encode()). Entries are
+    encoded and written chunksize at a time, so corpora of any size are
+    written in constant memory. Returns the number of records written. """
+    count = 0
+    chunk = np.zeros(chunksize, dtype=RECORD)
+    with open(path, 'wb') as f:
+        f.write(_header())
+        n = 0
+        for puzzle, solution, difficulty in entries:
+            chunk[n] = encode(puzzle, solution, difficulty)
+            n += 1
+            if n == chunksize:
+                chunk.tofile(f)
+                count += n
+                n = 0
+        chunk[:n].tofile(f)
+        count += n
+    return count
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+
+""" Candidate counts of a puzzle, kept up to date by the solvers as they
+change it, so that their search heuristics can look their answers up
+instead of scanning every cell and set at every step.
+Sudoku.candidate_counts() builds the counts of a puzzle; insert(),
+propagate(), remove(), and undo() update them if given them.
+
+Cells are bucketed by their number of candidates, so the cell with the
+fewest is found by looking through at most size + 1 buckets, and only the
+lowest index of the first nonempty one is searched for, to break ties as
+the scan does.
+"""
+
+
+class Counts:
+    """ represents the candidate counts of a puzzle:
+        positions   a list with an entry for every set (row, column, or box)
+                    and value, where positions[u * size + v - 1] is the
+                    number of unsolved cells of set topology.units[u] that
+                    still have v as a candidate; for fewest_positions()
+        buckets     a list of size + 1 sets, where buckets[k] holds the
+                    unsolved cells with k candidates; for
+                    fewest_candidates()
+        unsolved    the number of unsolved cells; for is_complete()
+    """
+
+    def __init__(self, size, units):
+        self.positions = [0] * (units * size)
+        self.buckets = [set() for k in range(size + 1)]
+        self.unsolved = 0
+
+
+    def copy(self):
+        """ returns an independent copy of these counts, e.g. to go with a
+        copy of the puzzle. """
+        res = Counts.__new__(Counts)
+        res.positions = self.positions[:]
+        res.buckets = [bucket.copy() for bucket in self.buckets]
+        res.unsolved = self.unsolved
+        return res
+
+
+    def fewest_candidates(self):
+        """ returns the index of the unsolved cell with the fewest
+        candidates, or -1 if every cell is solved, breaking ties as
+        Sudoku.fewest_candidates() does: the first cell with one candidate
+        or none, or else the first cell with the fewest. """
+        buckets = self.buckets
+        if buckets[0] or buckets[1]:
+            return min(buckets[0] | buckets[1])
+        for bucket in buckets:
+            if bucket:
+                return min(bucket)
+        return -1
+
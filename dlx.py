@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+
+import random
+from topology import topology
+
+
+""" cache of Sudoku exact cover matrices by size; sudoku_cover() hands out
+copies so the matrix is only built once per size.
+"""
+_sudoku_covers = {}
+
+
+class DancingLinks:
+    """ represents an exact cover problem as a sparse 0/1 matrix in Knuth's
+    dancing links form, and solves it with Algorithm X.
+
+    Every node of the matrix is an index into the parallel lists left, right,
+    up, down, column, and row. Node 0 is the root, nodes 1 to num_columns
+    are the column headers, and the remaining nodes are the 1s of the
+    matrix, each linked circularly to its neighbors in its row and column.
+    Covering a column unlinks it and every row that uses it; uncovering
+    relinks them in reverse order, so backtracking needs no copies.
+    """
+
+    def __init__(self, num_columns, rows):
+        """ rows is a list of lists of column numbers (0 to num_columns - 1);
+        each inner list is one row of the matrix. """
+        n = num_columns
+        self.num_columns = n
+        self.left = [n] + list(range(n))
+        self.right = list(range(1, n + 1)) + [0]
+        self.up = list(range(n + 1))
+        self.down = list(range(n + 1))
+        self.column = list(range(n + 1))
+        self.row = [-1] * (n + 1)
+        # number of nodes remaining in each column
+        self.size = [0] * (n + 1)
+        # first node of each row, for select()
+        self.row_start = []
+        # True for every column covered by select()
+        self.covered = [False] * (n + 1)
+
+        for r in range(len(rows)):
+            first = -1
+            for col in rows[r]:
+                c = col + 1
+                node = len(self.column)
+                self.column.append(c)
+                self.row.append(r)
+
+                # link node in at the bottom of its column
+                self.up.append(self.up[c])
+                self.down.append(c)
+                self.down[self.up[c]] = node
+                self.up[c] = node
+                self.size[c] += 1
+
+                # link node in at the end of its row
+                if first == -1:
+                    first = node
+                    self.left.append(node)
+                    self.right.append(node)
+                else:
+                    self.left.append(self.left[first])
+                    self.right.append(first)
+                    self.right[self.left[first]] = node
+                    self.left[first] = node
+            self.row_start.append(first)
+
+        # rows of each solution found by search()
+        self.solutions = []
+        """ number of rows tried at each search node that was exhausted, in
+        the order the nodes finished; same meaning as Sudoku.branch_factors
+        """
+        self.branch_factors = []
+        # search nodes entered by the last search(), count(), or sample()
+        self.nodes = 0
+
+
+    def copy(self):
+        """ returns an independent copy of the matrix in its current state. """
+        res = DancingLinks.__new__(DancingLinks)
+        res.num_columns = self.num_columns
+        res.left = self.left[:]
+        res.right = self.right[:]
+        res.up = self.up[:]
+        res.down = self.down[:]
+        res.column = self.column
+        res.row = self.row
+        res.size = self.size[:]
+        res.row_start = self.row_start
+        res.covered = self.covered[:]
+        res.solutions = []
+        res.branch_factors = []
+        res.nodes = 0
+        return res
+
+
+    def count(self, limit=2, max_nodes=None):
+        """ Algorithm X without the bookkeeping of search(): returns the
+        number of solutions, stopping as soon as limit have been found, but
+        stores neither the solutions nor branch factors. E.g., count(1) is 1
+        if the problem has any solution, and count(2) is 1 only if it has
+        exactly one. If max_nodes is given, the search gives up after
+        entering that many nodes and returns None, unless limit solutions
+        were found by then. """
+        return self._run(limit, record=False, max_nodes=max_nodes)
+
+
+    def cover(self, c):
+        """ removes column c from the header list, and every row with a node
+        in column c from the other columns it uses. """
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, size = self.column, self.size
+
+        left[right[c]] = left[c]
+        right[left[c]] = right[c]
+        i = down[c]
+        while i != c:
+            j = right[i]
+            while j != i:
+                up[down[j]] = up[j]
+                down[up[j]] = down[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+
+    def uncover(self, c):
+        """ reverses cover(c). Must be called in the reverse order of the
+        matching cover() calls. """
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, size = self.column, self.size
+
+        i = up[c]
+        while i != c:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                up[down[j]] = j
+                down[up[j]] = j
+                j = left[j]
+            i = up[i]
+        left[right[c]] = c
+        right[left[c]] = c
+
+
+    def select(self, r):
+        """ commits row r to every solution by covering the columns it uses,
+        e.g. for the givens of a puzzle. Returns False, covering nothing, if
+        one of those columns has already been covered by another selected
+        row (i.e., the problem has no solution). """
+        first = self.row_start[r]
+        node = first
+        while True:
+            if self.covered[self.column[node]]:
+                return False
+            node = self.right[node]
+            if node == first:
+                break
+
+        while True:
+            self.covered[self.column[node]] = True
+            self.cover(self.column[node])
+            node = self.right[node]
+            if node == first:
+                break
+        return True
+
+
+    def deselect(self, r):
+        """ reverses select(r), which must have returned True. Selected rows
+        must be deselected in the reverse order they were selected. """
+        first = self.row_start[r]
+        node = self.left[first]
+        while True:
+            self.uncover(self.column[node])
+            self.covered[self.column[node]] = False
+            if node == first:
+                break
+            node = self.left[node]
+
+
+    def exclude(self, r):
+        """ removes row r from the matrix, so no solution can use it; e.g.,
+        to rule out one value for one cell. The columns of row r must not be
+        covered. include(r) reverses it. """
+        first = self.row_start[r]
+        node = first
+        while True:
+            self.up[self.down[node]] = self.up[node]
+            self.down[self.up[node]] = self.down[node]
+            self.size[self.column[node]] -= 1
+            node = self.right[node]
+            if node == first:
+                break
+
+
+    def include(self, r):
+        """ reverses exclude(r). """
+        first = self.row_start[r]
+        node = self.left[first]
+        while True:
+            self.size[self.column[node]] += 1
+            self.up[self.down[node]] = node
+            self.down[self.up[node]] = node
+            if node == first:
+                break
+            node = self.left[node]
+
+
+    def sample(self, rng=random, max_nodes=None):
+        """ returns one solution, as a list of row numbers, or None if there
+        is none. Like search(limit=1), but the rows of each chosen column are
+        tried in random order (using rng, e.g. a random.Random), so repeated
+        calls give random solutions. Selected rows are not included.
+
+        Random searches sometimes wander into a subtree with no solutions
+        that takes very long to exhaust (e.g., on an empty 16x16 Sudoku). If
+        max_nodes is given, the search gives up, also returning None, after
+        entering that many nodes; it is usually faster to start again with
+        a new random order than to carry on. """
+        self.solutions = []
+        self.branch_factors = []
+        if self._run(1, rng, max_nodes=max_nodes):
+            return self.solutions[0]
+        return None
+
+
+    def search(self, limit=2):
+        """ Algorithm X. Finds solutions, up to the given limit, and stores
+        each as a list of row numbers in self.solutions. Selected rows are
+        not included. Returns the number of solutions found.
+
+        At each node the column with the fewest remaining rows is chosen, so
+        a column with a single row is a forced move rather than a guess. As
+        in Sudoku.solve_all(), a node that runs out of rows records nothing,
+        and a node that stops early because the limit was reached does not
+        record its branch factor.
+        """
+        self.solutions = []
+        self.branch_factors = []
+        return self._run(limit)
+
+
+    def _run(self, limit, rng=None, record=True, max_nodes=None):
+        """ helper function for count(), sample(), and search(). Runs
+        Algorithm X with an explicit stack rather than by recursion, since
+        the search goes as deep as a solution has rows (e.g., 256 for an
+        empty 16x16 Sudoku). Each frame of the stack is a list
+        [c, rows, i]: the column chosen at that node, its rows in the order
+        they are tried (shuffled with rng, if given), and the index of the
+        row being tried. If record is True, solutions and branch factors are
+        stored as search() describes. If max_nodes is given, the search stops
+        after entering that many nodes. Returns the number of solutions
+        found, or None if it stopped that way before finding limit of them.
+        """
+        right, down, left, column, row, size = (self.right, self.down,
+                                                self.left, self.column,
+                                                self.row, self.size)
+        found = 0
+        partial = []
+        stack = []
+        nodes = 0
+        # True once max_nodes nodes have been entered
+        stopped = False
+
+        while True:
+            # enter a search node
+            nodes += 1
+            if max_nodes is not None and nodes >= max_nodes:
+                stopped = True
+
+            if right[0] == 0:
+                # every column is covered; partial is a solution
+                found += 1
+                if record:
+                    self.solutions.append(partial[:])
+            else:
+                # choose column with fewest rows
+                c = right[0]
+                fewest = size[c]
+                j = right[c]
+                while j != 0 and fewest > 1:
+                    if size[j] < fewest:
+                        c = j
+                        fewest = size[j]
+                    j = right[j]
+
+                # a column with no rows can't be covered; dead end
+                if fewest > 0:
+                    self.cover(c)
+                    rows = []
+                    r = down[c]
+                    while r != c:
+                        rows.append(r)
+                        r = down[r]
+                    if rng is not None:
+                        rng.shuffle(rows)
+                    stack.append([c, rows, -1])
+
+            # back up to the deepest node with a row left to try
+            while stack:
+                frame = stack[-1]
+                c, rows, i = frame
+                if i >= 0:
+                    # reverse the row tried last
+                    r = rows[i]
+                    j = left[r]
+                    while j != r:
+                        self.uncover(column[j])
+                        j = left[j]
+                    partial.pop()
+
+                i += 1
+                if stopped or found >= limit or i == len(rows):
+                    self.uncover(c)
+                    stack.pop()
+                    if not stopped and found < limit and record:
+                        # search tree is exhausted from this node
+                        self.branch_factors.append(i)
+                    continue
+
+                frame[2] = i
+                r = rows[i]
+                partial.append(row[r])
+                j = right[r]
+                while j != r:
+                    self.cover(column[j])
+                    j = right[j]
+                break
+            else:
+                self.nodes = nodes
+                if stopped and found < limit:
+                    return None
+                return found
+
+
+def sudoku_cover(size=9):
+    """ returns a fresh DancingLinks matrix for a blank Sudoku puzzle of the
+    given size.
+
+    Row index * size + (value - 1) places value in cell index. Its four
+    columns are the constraints that placement satisfies: the cell is
+    filled, and value appears in the cell's row, column, and box.
+    """
+    if size not in _sudoku_covers:
+        topo = topology(size)
+        cells = topo.cells
+        rows = []
+        for index in range(cells):
+            for v in range(size):
+                rows.append([index,
+                             cells + topo.row_of[index] * size + v,
+                             2 * cells + topo.col_of[index] * size + v,
+                             3 * cells + topo.box_of[index] * size + v])
+        _sudoku_covers[size] = DancingLinks(4 * cells, rows)
+    return _sudoku_covers[size].copy()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+from topology import VALUES, puzzle_topology
+
+
+""" names of the propagation rules, in the order propagate() applies them;
+these are the keys of the elimination counts it reports """
+RULES = ('naked singles', 'hidden singles', 'naked pairs', 'hidden pairs')
+
+
+""" helper function for fewest_positions() and propagate(). returns a dict of
+the unsolved positions of each candidate value in the given unit (a list of
+cell indices), in the order values are first met. Solved cells are skipped.
+"""
+def unit_positions(puzzle, unit):
+    d = {}
+    for j in unit:
+        if isinstance(puzzle[j], int):
+            continue
+
+        for candidate in puzzle[j]:
+            if candidate in d:
+                d[candidate].append(j)
+            else:
+                d[candidate] = [j]
+    return d
+
+
+""" helper function for propagate(). inserts value into the given cell and
+removes it from the candidates of the cell's peers, like insert(), but also
+returns the number of candidates eliminated from peers. If trail (a list) is
+given, (index, old value) is appended to it for every changed cell.
+"""
+def place(puzzle, value, index, trail=None):
+    eliminated = 0
+    for j in puzzle_topology(puzzle).peers[index]:
+        if isinstance(puzzle[j], int):
+            continue
+        if value in puzzle[j]:
+            if trail is not None:
+                trail.append((j, puzzle[j]))
+            puzzle[j] = puzzle[j].replace(value, '')
+            eliminated += 1
+    if trail is not None:
+        trail.append((index, puzzle[index]))
+    puzzle[index] = VALUES[value]
+    return eliminated
+
+
+""" constraint propagation for puzzles in the string representation (see
+initialize() and Sudoku). Applies the following rules over and over until
+none of them changes the puzzle:
+    - naked singles: a cell with one candidate left is solved with it;
+    - hidden singles: a value with one position left in a unit is placed
+      there;
+    - naked pairs: two cells of a unit with the same two candidates claim
+      them, so both values are removed from the unit's other cells;
+    - hidden pairs: two values with the same two positions in a unit claim
+      those cells, so all other candidates are removed from them.
+The pair rules only run once the singles are exhausted, since they are the
+more expensive of the four. Returns the total number of candidates
+eliminated, or None if the puzzle turned out to be unsolvable (a cell with
+no candidates, a value with no position in some unit, or more than two
+values with the same two positions in some unit). If counts, a dict,
+is given, the eliminations made by each rule are added to counts[rule]. If
+trail, a list, is given, changes are recorded on it as in place().
+"""
+def propagate(puzzle, counts=None, trail=None):
+    topo = puzzle_topology(puzzle)
+    made = dict.fromkeys(RULES, 0)
+    if trail is None:
+        # record changes somewhere, to keep the rules below simple
+        trail = []
+
+    changed = True
+    while changed:
+        changed = False
+
+        # naked singles
+        for i in range(topo.cells):
+            if isinstance(puzzle[i], int):
+                continue
+            if len(puzzle[i]) == 0:
+                return _tally(None, made, counts)
+            if len(puzzle[i]) == 1:
+                made['naked singles'] += place(puzzle, puzzle[i], i, trail)
+                changed = True
+        if changed:
+            continue
+
+        # hidden singles; also catches values that can't go anywhere
+        for unit in topo.units:
+            d = unit_positions(puzzle, unit)
+            solved = sum(isinstance(puzzle[j], int) for j in unit)
+            if solved + len(d) < topo.size:
+                return _tally(None, made, counts)
+
+            for candidate in d:
+                position = d[candidate][0]
+                if (len(d[candidate]) == 1
+                    and not isinstance(puzzle[position], int)):
+                    # cell loses its other candidates, peers lose this one
+                    made['hidden singles'] += len(puzzle[position]) - 1
+                    made['hidden singles'] += place(puzzle, candidate,
+                                                    position, trail)
+                    changed = True
+        if changed:
+            continue
+
+        # naked pairs
+        for unit in topo.units:
+            pairs = {}
+            for j in unit:
+                if not isinstance(puzzle[j], int) and len(puzzle[j]) == 2:
+                    pairs.setdefault(puzzle[j], []).append(j)
+
+            for pair in pairs:
+                if len(pairs[pair]) != 2:
+                    continue
+                for j in unit:
+                    if isinstance(puzzle[j], int) or j in pairs[pair]:
+                        continue
+                    for candidate in pair:
+                        if candidate in puzzle[j]:
+                            trail.append((j, puzzle[j]))
+                            puzzle[j] = puzzle[j].replace(candidate, '')
+                            made['naked pairs'] += 1
+                            changed = True
+        if changed:
+            continue
+
+        # hidden pairs
+        for unit in topo.units:
+            d = unit_positions(puzzle, unit)
+            twos = [c for c in d if len(d[c]) == 2]
+            # values with two positions, grouped by those positions; more
+            # than two values can't all go in the same two cells
+            groups = {}
+            for c in twos:
+                groups.setdefault(tuple(d[c]), []).append(c)
+            if any(len(group) > 2 for group in groups.values()):
+                return _tally(None, made, counts)
+
+            for a in range(len(twos)):
+                for b in range(a + 1, len(twos)):
+                    if d[twos[a]] != d[twos[b]]:
+                        continue
+                    for j in d[twos[a]]:
+                        # keep the pair's values in the cell's original order
+                        keep = ''.join(c for c in puzzle[j]
+                                       if c == twos[a] or c == twos[b])
+                        if keep != puzzle[j]:
+                            made['hidden pairs'] += (len(puzzle[j])
+                                                     - len(keep))
+                            trail.append((j, puzzle[j]))
+                            puzzle[j] = keep
+                            changed = True
+
+    return _tally(sum(made.values()), made, counts)
+
+
+# helper function for propagate(); adds made into counts and returns res
+def _tally(res, made, counts):
+    if counts is not None:
+        for rule in made:
+            counts[rule] = counts.get(rule, 0) + made[rule]
+    return res
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+import gzip
+from topology import SYMBOLS, VALUES
+
+
+""" Reading and writing puzzles in the common one-puzzle-per-line format: each
+line holds the cells of a puzzle in row-major order, one character per cell,
+with '.' or '0' for an empty cell; e.g., 81 characters for a 9x9 puzzle.
+Values past 9, in larger puzzles, are written as letters (see
+topology.SYMBOLS): 'A' for 10, 'B' for 11, and so on.
+Anything after the first run of whitespace on a line is ignored, as are
+blank lines and lines starting with '#'.
+
+Every function here streams: puzzles are read and written one line at a
+time, so files of any size can be processed in constant memory. Paths ending
+in '.gz' are read and written through gzip.
+"""
+
+
+def _open(path, mode):
+    # helper function; opens path as text, through gzip if it ends in .gz
+    if str(path).endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='ascii')
+    return open(path, mode, encoding='ascii')
+
+
+def format_puzzle(puzzle):
+    """ returns the line for the given puzzle: solved cells (ints) become
+    their symbol, and any other cell (0, or a string of candidates) becomes
+    '.'. """
+    return ''.join(SYMBOLS[cell - 1] if isinstance(cell, int) and cell > 0
+                   else '.' for cell in puzzle)
+
+
+def parse_puzzle(line, size=9):
+    """ returns the puzzle list, as given to Sudoku(), for the given line.
+    Raises ValueError if the line is not size**2 cells long or has a
+    character that is not '.', '0', or the symbol of a value up to size. """
+    cells = line.split(None, 1)[0] if line.strip() else ''
+    if len(cells) != size**2:
+        raise ValueError(f"expected {size**2} cells, got {len(cells)}")
+
+    puzzle = []
+    for c in cells:
+        if c == '.' or c == '0':
+            puzzle.append(0)
+        elif VALUES.get(c, size + 1) <= size:
+            puzzle.append(VALUES[c])
+        else:
+            raise ValueError(f"unexpected character {c!r} in puzzle")
+    return puzzle
+
+
+def read_puzzles(path, size=9):
+    """ yields, lazily, every puzzle in the file at path as a puzzle list,
+    ready for Sudoku() or solve_many(). Errors name the offending line. """
+    with _open(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            try:
+                yield parse_puzzle(line, size)
+            except ValueError as e:
+                raise ValueError(f"{path}, line {number}: {e}") from None
+
+
+def write_puzzles(path, puzzles):
+    """ writes every puzzle of the iterable puzzles to the file at path, one
+    per line. Returns the number of puzzles written. """
+    count = 0
+    with _open(path, 'w') as f:
+        for puzzle in puzzles:
+            f.write(format_puzzle(puzzle) + '\n')
+            count += 1
+    return count
+
+
+def write_results(path, results, size=9):
+    """ writes solve results to the file at path, one line per result:
+        <solution> <difficulty>
+    where results is an iterable of dicts with 'solutions' and 'difficulty'
+    keys, as yielded by solve_many(). The solution is written only if it is
+    unique; otherwise the line starts with a puzzle of empty cells, so every
+    line still parses with read_puzzles(). Returns the number of results
+    written. """
+    count = 0
+    with _open(path, 'w') as f:
+        for result in results:
+            if len(result['solutions']) == 1:
+                line = format_puzzle(result['solutions'][0])
+            else:
+                line = '.' * size**2
+            f.write(f"{line} {result['difficulty']}\n")
+            count += 1
+    return count
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import math
+import struct
+
+
+""" Compact records of scored puzzles, for keeping whole corpora in memory.
+
+A Sudoku object carries its candidate strings, solution lists, branch
+factors, and settings, several kilobytes in all; a Record keeps only what
+analytics need, the givens, the unique solution, and the difficulty, packed
+into a single bytes object:
+    difficulty  little-endian float64, NaN if not uniquely solvable
+    solved      1 byte: 1 if cells below hold the unique solution, 0 if
+                they hold the givens, and 0 elsewhere
+    givens      size**2 bits: mask of the cells given in the puzzle, most
+                significant bit first, zero-padded to whole bytes
+    cells       size**2 bytes: one value per cell
+A 9x9 record takes under 200 bytes, and records have no __dict__. Convert
+with Sudoku.to_record() and Sudoku.from_record(); records pickle, compare,
+and hash by value.
+"""
+HEAD = struct.Struct('<dB')
+
+
+class Record:
+    """ represents a puzzle, its unique solution, if it has one, and its
+    difficulty, packed into bytes (see above). givens and solution are
+    lists of ints, 0 for empty cells, as given to Sudoku(). """
+
+    __slots__ = ('size', 'data')
+
+    def __init__(self, givens, solution=None, difficulty=math.nan):
+        self.size = math.isqrt(len(givens))
+        cells = len(givens)
+        mask = 0
+        for cell in givens:
+            mask = mask << 1 | (cell != 0)
+        mask <<= -cells % 8
+        self.data = (HEAD.pack(difficulty, solution is not None)
+                     + mask.to_bytes((cells + 7) // 8, 'big')
+                     + bytes(solution if solution is not None else givens))
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Record):
+            return NotImplemented
+        return self.data == other.data
+
+
+    def __getstate__(self):
+        return self.size, self.data
+
+
+    def __hash__(self):
+        return hash(self.data)
+
+
+    def __repr__(self):
+        return (f"Record(size={self.size}, difficulty={self.difficulty}, "
+                f"solved={self.solved})")
+
+
+    def __setstate__(self, state):
+        self.size, self.data = state
+
+
+    def as_tuple(self):
+        """ returns (givens, solution, difficulty), e.g. as an entry for
+        corpus.write_corpus(); solution is None if not uniquely solved. """
+        return self.givens, self.solution, self.difficulty
+
+
+    @property
+    def difficulty(self):
+        return HEAD.unpack_from(self.data)[0]
+
+
+    @property
+    def givens(self):
+        cells = self.size**2
+        start = HEAD.size + (cells + 7) // 8
+        mask = int.from_bytes(self.data[HEAD.size:start], 'big')
+        mask >>= -cells % 8
+        values = self.data[start:]
+        return [values[i] if mask >> (cells - 1 - i) & 1 else 0
+                for i in range(cells)]
+
+
+    @property
+    def solution(self):
+        if not self.solved:
+            return None
+        return list(self.data[-self.size**2:])
+
+
+    @property
+    def solved(self):
+        return bool(self.data[HEAD.size - 1])
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+import random
+import time
+
+
+class Search:
+    """ represents an in-progress, iterative run of Sudoku.solve_trail().
+
+    solve_trail() recurses once per branch; this class makes the same
+    search, in the same order, with an explicit stack instead, so deep
+    searches (e.g., on 16x16 puzzles) can't hit the recursion limit.
+    Like solve_trail(), it changes a single copy of the puzzle in place and
+    reverses each branch with the sudoku's undo().
+
+    Solutions and branch factors are stored on the Sudoku object that owns
+    the search, exactly where solve_all() would put them. run() can stop
+    after a given number of nodes or seconds, and be called again later to
+    carry on where it stopped.
+
+    A stopped search can be pickled, along with its sudoku, and run on from
+    the unpickled copy, e.g. to checkpoint a long uniqueness check or to
+    hand it to another process. Branches are tried in random order as
+    nodes are entered, so the resumed search makes the same choices as an
+    uninterrupted one only if random is in the same state; the solutions
+    found are the same either way.
+    """
+
+    def __init__(self, sudoku, puzzle=None):
+        self.sudoku = sudoku
+        if puzzle is None:
+            puzzle = sudoku.puzzle
+        self.puzzle = puzzle[:]
+        self.trail = []
+        # candidate counts of the puzzle (see Sudoku.candidate_counts()),
+        # kept up to date along with it
+        self.counts = sudoku.candidate_counts(self.puzzle)
+
+        """ one frame per open search node, deepest last. A frame is a list
+        [search_set, tried, mark]: the (candidate, position) pairs to try,
+        the number tried so far (i.e., the branches taken), and the trail
+        length before the pair being tried was inserted. """
+        self.stack = []
+
+        # number of search nodes entered, including the root
+        self.nodes = 0
+        # True once the search is exhausted, or stopped at 2 solutions
+        self.done = False
+        # whether the root node has been entered
+        self.started = False
+        # True once a solution has been found past the second
+        self.stopped = False
+        # True if the last node entered was a solution
+        self.solved = False
+
+
+    def __getstate__(self):
+        """ returns the state to pickle, with every cell and value, in the
+        puzzle, the trail, and the stack, packed as an int by the sudoku;
+        the trail and search sets are flattened into lists of ints. The
+        counts are left out and rebuilt from the puzzle. """
+        sudoku = self.sudoku
+        state = self.__dict__.copy()
+        del state['counts']
+        state['puzzle'] = [sudoku._pack_cell(cell) for cell in self.puzzle]
+        state['trail'] = [n for index, cell in self.trail
+                          for n in (index, sudoku._pack_cell(cell))]
+        state['stack'] = [[[n for candidate, position in search_set
+                            for n in (sudoku._pack_value(candidate),
+                                      position)],
+                           tried, mark]
+                          for search_set, tried, mark in self.stack]
+        return state
+
+
+    def __setstate__(self, state):
+        """ restores a pickled search; reverses __getstate__(). """
+        self.__dict__.update(state)
+        sudoku = self.sudoku
+        self.puzzle = [sudoku._unpack_cell(cell) for cell in self.puzzle]
+        trail = state['trail']
+        self.trail = [(trail[k], sudoku._unpack_cell(trail[k + 1]))
+                      for k in range(0, len(trail), 2)]
+        self.stack = [[[(sudoku._unpack_value(flat[k]), flat[k + 1])
+                        for k in range(0, len(flat), 2)],
+                       tried, mark]
+                      for flat, tried, mark in self.stack]
+        self.counts = sudoku.candidate_counts(self.puzzle)
+
+
+    def run(self, max_nodes=None, time_limit=None):
+        """ runs the search until it is done, or until max_nodes more nodes
+        have been entered or time_limit seconds have passed. Returns True if
+        the search is done, or False if it stopped early; in that case the
+        search is left in a consistent state and run() may be called again.
+        """
+        if self.done:
+            return True
+
+        node_limit = None if max_nodes is None else self.nodes + max_nodes
+        deadline = None if time_limit is None else (time.perf_counter()
+                                                    + time_limit)
+        sudoku = self.sudoku
+        stack = self.stack
+        stats = sudoku.stats
+
+        if not self.started:
+            self.started = True
+            if not self._enter():
+                self.done = True
+                return True
+
+        while stack:
+            if ((node_limit is not None and self.nodes >= node_limit)
+                or (deadline is not None and time.perf_counter() >= deadline)):
+                return False
+
+            frame = stack[-1]
+            search_set, tried = frame[0], frame[1]
+            if tried == len(search_set):
+                # search tree is exhausted from this node; reverse the
+                # parent's branch that led here
+                sudoku.branch_factors.append(tried)
+                stack.pop()
+                if stack:
+                    sudoku.undo(self.puzzle, self.trail, stack[-1][2],
+                                self.counts)
+                    if stats is not None:
+                        stats.unbranch(False)
+                continue
+
+            candidate, position = search_set[tried]
+            frame[1] = tried + 1
+            frame[2] = len(self.trail)
+            sudoku.insert(candidate, position, self.puzzle, self.trail,
+                          self.counts)
+            if stats is not None:
+                stats.branch()
+
+            if self._enter():
+                # new search node pushed; descend into it
+                continue
+
+            # branch ended in a solution or a dead end; reverse it
+            sudoku.undo(self.puzzle, self.trail, frame[2], self.counts)
+            if stats is not None:
+                stats.unbranch(self.solved)
+            if self.stopped:
+                # more than one solution found; stop search, backing out
+                # of the open nodes as solve_trail() returns through them
+                stack.pop()
+                while stack:
+                    sudoku.undo(self.puzzle, self.trail, stack[-1][2],
+                                self.counts)
+                    if stats is not None:
+                        stats.unbranch(True)
+                    stack.pop()
+                break
+
+        self.done = True
+        return True
+
+
+    def _enter(self):
+        """ helper function for run(). makes the forced moves (and, if the
+        sudoku has propagation on, propagates) on the current puzzle, like
+        the top of solve_trail(). If a branch is needed, pushes a frame for
+        it and returns True; otherwise the node is a dead end or a solution
+        and it returns False. """
+        sudoku = self.sudoku
+        puzzle = self.puzzle
+        stats = sudoku.stats
+        self.nodes += 1
+        self.stopped = False
+        self.solved = False
+        if stats is not None:
+            stats.enter(puzzle)
+
+        # whether propagate() has nothing left to do on puzzle
+        fixed_point = False
+
+        while not sudoku.is_complete(puzzle, self.counts):
+            i = (sudoku.fewest_candidates(puzzle, self.counts)
+                 if stats is None else
+                 stats.call('fewest_candidates', sudoku.fewest_candidates,
+                            puzzle, self.counts))
+            candidates = sudoku.cell_candidates(puzzle[i])
+
+            if len(candidates) == 1:
+                sudoku.insert(candidates[0], i, puzzle, self.trail,
+                              self.counts)
+                continue
+            if len(candidates) == 0:
+                return False
+
+            if sudoku.propagation and not fixed_point:
+                eliminated = sudoku.propagate(puzzle, self.trail,
+                                              self.counts)
+                if eliminated is None:
+                    return False
+                fixed_point = True
+                if eliminated:
+                    continue
+
+            search_set = []
+            fpp_value, fpp_positions = (
+                sudoku.fewest_positions(puzzle, self.counts)
+                if stats is None else
+                stats.call('fewest_positions', sudoku.fewest_positions,
+                           puzzle, self.counts))
+
+            if len(fpp_positions) < len(candidates):
+                for position in fpp_positions:
+                    search_set.append((fpp_value, position))
+            else:
+                for candidate in random.sample(candidates, len(candidates)):
+                    search_set.append((candidate, i))
+
+            self.stack.append([search_set, 0, len(self.trail)])
+            return True
+
+        # puzzle is complete; store a copy, since it will be undone
+        solution = puzzle[:]
+        self.solved = True
+        if stats is not None:
+            stats.solved(solution)
+        if solution not in sudoku.solutions:
+            sudoku.solutions.append(solution)
+        # solve_trail() stops at the first solution found past the second
+        self.stopped = len(sudoku.solutions) >= 2
+        return False
@@ -1,23 +1,127 @@
 # file for testing puzzle solves
-import time
-import random
+import copy
+import gc
+import math
 import statistics
+import time
+from functools import partial
+
+""" Timing of solver calls, for simulate() below and for benchmark.py.
+
+measure() times calls of a function with time.perf_counter_ns(), after a
+few untimed warmup calls, with the garbage collector off (by default) so
+that a collection doesn't land inside one call and not another. Each call
+can get fresh arguments from an untimed setup function, since most solvers
+change the puzzle they are given. It returns a result, a dict of summary
+statistics of the call times, all in nanoseconds:
+    runs        number of timed calls
+    warmup      number of untimed calls made first
+    mean_ns     mean call time
+    stdev_ns    sample standard deviation of the call times
+    ci_low_ns   lower and upper bound of the confidence interval (95% by
+    ci_high_ns  default) of the mean, from the normal approximation
+    min_ns      fastest call
+    p50_ns      median, and 95th and 99th percentiles, interpolated
+    p95_ns      linearly between the nearest ranks
+    p99_ns
+    max_ns      slowest call
+The percentiles are more robust than the mean, since solvers that branch
+at random have a long tail of slow calls.
+"""
+
+
+def measure(fn, *args, setup=None, repeat=100, warmup=5, max_time=None,
+            gc_enabled=False, confidence=0.95):
+    """ calls fn warmup times, then times repeat more calls, and returns the
+    result (see above). Each call is fn(*setup()) if setup is given, or
+    fn(*args) otherwise; setup is not timed.
+
+    If max_time is given, timing stops after max_time seconds once at least
+    two calls have been timed, even if fewer than repeat; e.g., for solvers
+    that take seconds a call. The garbage collector is disabled while
+    timing unless gc_enabled is True, and a collection is run first either
+    way.
+    """
+    def call_args():
+        return setup() if setup is not None else args
+
+    was_enabled = gc.isenabled()
+    gc.collect()
+    if not gc_enabled:
+        gc.disable()
+    try:
+        for k in range(warmup):
+            fn(*call_args())
+
+        times = []
+        deadline = (None if max_time is None
+                    else time.perf_counter_ns() + int(max_time * 1e9))
+        while len(times) < repeat:
+            current = call_args()
+            t0 = time.perf_counter_ns()
+            fn(*current)
+            t1 = time.perf_counter_ns()
+            times.append(t1 - t0)
+            if (deadline is not None and len(times) >= 2
+                and t1 >= deadline):
+                break
+    finally:
+        if was_enabled:
+            gc.enable()
+
+    return summarize(times, warmup, confidence)
+
+
+def summarize(times, warmup=0, confidence=0.95):
+    """ returns the result (see above) for the given call times, in
+    nanoseconds. """
+    n = len(times)
+    ordered = sorted(times)
+    mean = statistics.fmean(ordered)
+    stdev = statistics.stdev(ordered) if n > 1 else 0.0
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    half_width = z * stdev / math.sqrt(n)
+    return {'runs': n,
+            'warmup': warmup,
+            'mean_ns': mean,
+            'stdev_ns': stdev,
+            'ci_low_ns': mean - half_width,
+            'ci_high_ns': mean + half_width,
+            'min_ns': ordered[0],
+            'p50_ns': _percentile(ordered, 50),
+            'p95_ns': _percentile(ordered, 95),
+            'p99_ns': _percentile(ordered, 99),
+            'max_ns': ordered[-1]}
+
+
+def _percentile(ordered, q):
+    # helper function; the qth percentile of the sorted list ordered,
+    # interpolated linearly between the nearest ranks
+    position = (len(ordered) - 1) * q / 100
+    lo = math.floor(position)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (position - lo)
+
 
 """ simulation function that takes given arguments and performs given
 function with those arguments for given number of times, then reports
-summary results.
+summary results. Each call gets a fresh copy of the arguments, since
+solvers change the puzzle they are given; keyword arguments (e.g., a
+SolveStats to count on) are passed to every call as they are. Returns the
+result of measure().
 """
-def simulate(fn, *args, num_sims=1000):
-    times = []
-    for i in range(num_sims):
-        t0 = time.time()
-        fn(*args)
-        t1 = time.time()
-        times.append(t1 - t0)
-
-    mean = statistics.mean(times)
-    var = statistics.variance(times)
-
-    print(f"{fn} called {num_sims} times.")
-    print(f"\tmean {mean * 1000:.10f} ms per call")
-    print(f"\tvar  {var * 1000:.10f} ms per call")
+def simulate(fn, *args, num_sims=1000, warmup=10, **kwargs):
+    result = measure(partial(fn, **kwargs),
+                     setup=lambda: copy.deepcopy(args),
+                     repeat=num_sims, warmup=warmup)
+
+    print(f"{fn.__name__} called {num_sims} times "
+          f"(after {warmup} warmup calls).")
+    print(f"\tmean  {result['mean_ns'] / 1e6:.4f} ms per call "
+          f"(95% CI {result['ci_low_ns'] / 1e6:.4f} to "
+          f"{result['ci_high_ns'] / 1e6:.4f})")
+    print(f"\tstdev {result['stdev_ns'] / 1e6:.4f} ms")
+    print(f"\tp50   {result['p50_ns'] / 1e6:.4f} ms, "
+          f"p95 {result['p95_ns'] / 1e6:.4f} ms, "
+          f"p99 {result['p99_ns'] / 1e6:.4f} ms")
+    return result
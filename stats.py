@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+import time
+from propagation import RULES
+
+
+""" Instrumentation of the solvers. A solver given a SolveStats (e.g., through
+Sudoku(stats=...), or the stats argument of the solve functions of
+sudoku_simulations) counts its work on it; given None, as by default, it
+skips every count behind a single test, so uninstrumented solves cost the
+same as before. Stats are plain counters, so the stats of many solves,
+e.g. from the workers of solve_many(), can be added up with merge() or
+total().
+"""
+
+
+class SolveStats:
+    """ represents the counters of one or more solves.
+
+    The optional hooks are called as the search goes:
+        on_node(depth, puzzle)      on entering a search node
+        on_backtrack(depth)         on returning from a branch without a
+                                    solution, at the parent's depth
+        on_solution(puzzle)         on completing a solution
+    Hooks are dropped when stats are pickled (e.g., sent back from a worker
+    process), since they may not be picklable.
+    """
+
+    def __init__(self, on_node=None, on_backtrack=None, on_solution=None):
+        # search nodes entered, including the root of each solve
+        self.nodes = 0
+        """ branches that came back without a solution to pass up: dead
+        ends, and nodes whose search tree was exhausted """
+        self.backtracks = 0
+        # depth of the deepest node entered; the root is at depth 0
+        self.max_depth = 0
+        # depth of the node being searched
+        self.depth = 0
+        # solutions completed
+        self.solutions = 0
+        # calls of propagate(), and the candidates each rule eliminated
+        self.propagations = 0
+        self.eliminations = dict.fromkeys(RULES, 0)
+        """ puzzles copied to branch on: one per branch for solvers that
+        copy (e.g., solve_all()), none for those that undo (solve_trail())
+        """
+        self.copies = 0
+        # nanoseconds spent in the search heuristics, timed by call()
+        self.time_ns = {'fewest_candidates': 0, 'fewest_positions': 0}
+
+        self.on_node = on_node
+        self.on_backtrack = on_backtrack
+        self.on_solution = on_solution
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['on_node'] = state['on_backtrack'] = state['on_solution'] = None
+        return state
+
+
+    def __iadd__(self, other):
+        self.merge(other)
+        return self
+
+
+    def __repr__(self):
+        return f"SolveStats({self.as_dict()})"
+
+
+    def as_dict(self):
+        """ returns the counters as a dict, e.g. for JSON. """
+        return {'nodes': self.nodes,
+                'backtracks': self.backtracks,
+                'max_depth': self.max_depth,
+                'solutions': self.solutions,
+                'propagations': self.propagations,
+                'eliminations': dict(self.eliminations),
+                'copies': self.copies,
+                'time_ns': dict(self.time_ns)}
+
+
+    def branch(self, copied=False):
+        """ called before a solver descends into a branch; copied is True if
+        it copied the puzzle to do so. """
+        self.depth += 1
+        if copied:
+            self.copies += 1
+
+
+    def call(self, name, fn, *args):
+        """ returns fn(*args), adding the time it took to time_ns[name]. """
+        t0 = time.perf_counter_ns()
+        res = fn(*args)
+        self.time_ns[name] = (self.time_ns.get(name, 0)
+                              + time.perf_counter_ns() - t0)
+        return res
+
+
+    def enter(self, puzzle):
+        """ called by a solver on entering a search node for puzzle. """
+        self.nodes += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+        if self.on_node is not None:
+            self.on_node(self.depth, puzzle)
+
+
+    def merge(self, other):
+        """ adds the counters of other to these; max_depth becomes the larger
+        of the two. """
+        self.nodes += other.nodes
+        self.backtracks += other.backtracks
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.solutions += other.solutions
+        self.propagations += other.propagations
+        for rule in other.eliminations:
+            self.eliminations[rule] = (self.eliminations.get(rule, 0)
+                                       + other.eliminations[rule])
+        self.copies += other.copies
+        for name in other.time_ns:
+            self.time_ns[name] = (self.time_ns.get(name, 0)
+                                  + other.time_ns[name])
+
+
+    def propagated(self, made):
+        """ called after a solver runs propagate(); made is a dict of the
+        eliminations of each rule. """
+        self.propagations += 1
+        for rule in made:
+            self.eliminations[rule] += made[rule]
+
+
+    def solved(self, puzzle):
+        """ called by a solver on completing a solution. """
+        self.solutions += 1
+        if self.on_solution is not None:
+            self.on_solution(puzzle)
+
+
+    def unbranch(self, solved):
+        """ called after a branch returns to the solver that called branch();
+        solved is True if it came back with a solution. """
+        self.depth -= 1
+        if not solved:
+            self.backtracks += 1
+            if self.on_backtrack is not None:
+                self.on_backtrack(self.depth)
+
+
+def total(stats):
+    """ returns a new SolveStats with the counters of every SolveStats in the
+    iterable stats added up. """
+    res = SolveStats()
+    for s in stats:
+        res.merge(s)
+    return res
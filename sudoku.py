@@ -1,9 +1,21 @@
 #!/usr/bin/env python3
 
+# importing this module builds no puzzles and imports nothing heavy, so pool
+# workers start cheaply; keep it under 10ms (check: python -X importtime)
 import random
 import math
+import heapq
+import struct
 import time
-import numpy as np
+from functools import partial
+from counts import Counts
+from dlx import sudoku_cover
+from propagation import RULES, propagate, unit_positions
+from record import Record
+from search import Search
+from stats import SolveStats
+from symmetry import apply_transform, canonical_form, random_transform
+from topology import SYMBOLS, VALUES, topology
 
 
 """ todos:
@@ -13,12 +25,12 @@ import numpy as np
     - write scoring function                              DONE 02/11
     - set-oriented solve optimization                     DONE 05/11
     - debug solve_all() (branching too much)
-    - pickle puzzles
-    - white generate() to generate puzzles                IN PROGRESS 06/11
+    - pickle puzzles                                      DONE 18/10
+    - white generate() to generate puzzles                DONE 18/10
         - write remove() helper fn                        DONE 06/11
-    - enhance generate() for target and max difficulty
-    - generalize turtle fns for puzzles not 9x9
-    - generalize initialize() and make() for size
+    - enhance generate() for target and max difficulty    DONE 18/10
+    - generalize turtle fns for puzzles not 9x9           DONE 18/10
+    - generalize initialize() and make() for size         DONE 18/10
     - implement GUI
         - fill cells
         - call for solvability
@@ -42,17 +54,41 @@ import numpy as np
 class Sudoku:
     """ represents a Sudoku puzzle """
 
-    # TODO: error catch sizes that aren't perfect squares or not int
-    # TODO: generalize to Sudokus of any (perfect square) size
-    def __init__(self, size=9, label=time.time(), puzzle=[]):
+    def __init__(self, size=9, label=None, puzzle=[],
+                 engine='backtrack', propagation=False, cache=None,
+                 stats=None, solve=True):
+        if engine not in ('backtrack', 'dlx', 'trail', 'iterative'):
+            raise ValueError(f"unknown solver engine {engine!r}")
+
         # instance attributes:
         self.puzzle = []
         self.size = size
-        self.box_size = int(math.sqrt(size))
-        self.label = str(label)
-        self.candidates = ''
-        for i in range(self.size):
-            self.candidates += str(i + 1)
+        """ row, column, box, and peer index tables shared by this puzzle
+        size; raises ValueError if size is not a supported perfect square """
+        self.topology = topology(size)
+        self.box_size = self.topology.box_size
+        # label defaults to the time the puzzle was made
+        self.label = str(time.time() if label is None else label)
+        """ solver used by solve(): 'backtrack' for solve_all(), 'dlx' for
+        solve_dlx(), 'trail' for solve_trail(), or 'iterative' for a
+        Search from search() """
+        self.engine = engine
+        """ whether solve_all() runs propagate() to a fixed point before
+        each branch. Off by default: fewer branches means lower difficulty
+        scores, so scores with and without it are not comparable. """
+        self.propagation = propagation
+        """ optional cache of solve results (see cache.py); solve() looks
+        puzzles up in it before solving, and stores what it solves. A hit
+        restores the results of the solve, eliminations included, but
+        counts nothing on stats, since no search is made """
+        self.cache = cache
+        """ optional SolveStats (see stats.py) the solvers count their work
+        on; it is never reset, so pass a fresh one to count a single solve,
+        or share one to total many """
+        self.stats = stats
+        """ every candidate, one character per value (see topology.SYMBOLS),
+        so that values past 9 can't clash: e.g., '123456789ABCDEFG' """
+        self.candidates = SYMBOLS[:size]
                
         """ A puzzle is a list of elements that are either strings of candidate
         values for a particular cell, or the integer solution for that cell.
@@ -79,8 +115,10 @@ class Sudoku:
         where B is the sum (Bi - 1) ** 2 for every branching factor, and E is
         the number of empty cells in the given puzzle. This score is computed
         in score() if and only if a single solution has been found. """
-        self.difficulty = np.NaN
+        self.difficulty = math.nan
         self.branch_factors = []
+        # candidates eliminated by each propagate() rule during last solve
+        self.eliminations = dict.fromkeys(RULES, 0)
 
         if puzzle == []:
             # user has not provided puzzle values; make a puzzle from scratch
@@ -91,29 +129,144 @@ class Sudoku:
 
             """ step one: set self.puzzle to a blank puzzle """
             for i in range(self.size ** 2):
-                self.puzzle.append(self.candidates)
+                self.puzzle.append(self.blank())
 
             """ step two: insert any given values with insert(), which also
             removes that value from the candidate list of neighbors """
             for i in range(len(puzzle)):
                 if isinstance(puzzle[i], int) and puzzle[i] != 0:
                     # caller provided value for cell
-                    self.insert(str(puzzle[i]), i)
+                    self.insert(SYMBOLS[puzzle[i] - 1], i)
 
-            """ step three: store solution and score puzzle """
-            self.solve(report=False)
+            """ step three: store solution and score puzzle, unless the
+            caller has them already (e.g., from_record()) """
+            if solve:
+                self.solve(report=False)
         
 
+    def __getstate__(self):
+        """ returns the state to pickle: the settings, the givens (solved
+        cells) of the puzzle, and the results of the last solve, all as
+        ints or bytes rather than candidate strings, so that pickles are
+        small and cheap to send to worker processes. The cache is left out,
+        since it may hold an open database. """
+        givens = [cell if self.is_solved(cell) else 0 for cell in self.puzzle]
+        return {'size': self.size,
+                'label': self.label,
+                'engine': self.engine,
+                'propagation': self.propagation,
+                'stats': self.stats,
+                'givens': bytes(givens),
+                'solutions': [bytes(solution) for solution in self.solutions],
+                'branch_factors': bytes(self.branch_factors),
+                'difficulty': self.difficulty,
+                'eliminations': [self.eliminations[rule] for rule in RULES]}
+
+
+    def __setstate__(self, state):
+        """ restores a pickled sudoku; the puzzle is rebuilt from its givens,
+        as in __init__(), but not solved again. """
+        self.__init__(state['size'], state['label'], list(state['givens']),
+                      state['engine'], state['propagation'], None,
+                      state['stats'], solve=False)
+        self.solutions = [list(solution) for solution in state['solutions']]
+        self.branch_factors = list(state['branch_factors'])
+        self.difficulty = state['difficulty']
+        self.eliminations = dict(zip(RULES, state['eliminations']))
+
+
     def __str__(self):
         return self.print()
 
 
-    def fewest_candidates(self, puzzle=None):
+    def blank(self):
+        """ returns the value of an unsolved cell with every candidate still
+        available. Helper function for __init__() and remove(). """
+        return self.candidates
+
+
+    def cache_key(self, puzzle=None):
+        """ returns the key of the given puzzle in self.cache: its size, the
+        solver settings that affect branch_factors and difficulty, and its
+        givens (solved cells) in order, as a string. """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        givens = bytes(cell if self.is_solved(cell) else 0 for cell in puzzle)
+        return (f"{self.size}:{self.engine}:{int(self.propagation)}:"
+                + givens.hex())
+
+
+    def candidate_counts(self, puzzle=None):
+        """ returns the Counts of puzzle (see counts.py), for
+        fewest_candidates(), fewest_positions(), and is_complete(). insert(),
+        propagate(), remove(), and undo() keep them up to date if given
+        them, so the solvers build them once per solve rather than scanning
+        every cell and set at every step. """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        counts = Counts(self.size, len(self.topology.units))
+        for i in range(len(puzzle)):
+            # 0 stands for a solved cell in either engine
+            self._recount(counts, i, 0, puzzle[i])
+        return counts
+
+
+    def canonical_form(self, puzzle=None):
+        """ returns (canonical, transform): the canonical form of the givens
+        (solved cells) of the given puzzle, as a list of ints with 0 for
+        empty cells, and the transform that maps the givens to it; see
+        symmetry.py. Equivalent puzzles have the same canonical form, and
+        symmetry.restore(solution, transform) maps a solution of the
+        canonical form back to a solution of the puzzle. """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        givens = [cell if self.is_solved(cell) else 0 for cell in puzzle]
+        return canonical_form(givens, self.size)
+
+
+    def cell_candidates(self, cell):
+        """ returns the candidates of the given unsolved cell value as a
+        sequence of values insert() accepts. Helper function for
+        solve_trail(). """
+        return cell
+
+
+    def count_solutions(self, puzzle=None, limit=2):
+        """ returns the number of solutions of the given puzzle, counting no
+        further than limit; e.g., with the default limit of 2, 0 means no
+        solution, 1 a unique solution, and 2 more than one. Only solved
+        cells of puzzle are used as givens.
+
+        Unlike solve(), this keeps no solutions, branch factors, or
+        difficulty, and leaves the sudoku unchanged; it always uses the dlx
+        exact cover search, whatever the engine, since that is the fastest.
+        """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        cover = sudoku_cover(self.size)
+        for i in range(len(puzzle)):
+            if self.is_solved(puzzle[i]):
+                if not cover.select(i * self.size + puzzle[i] - 1):
+                    # value already used in cell's row, column, or box
+                    return 0
+
+        return cover.count(limit)
+
+
+    def fewest_candidates(self, puzzle=None, counts=None):
         """ helper function for solve_all(). returns the index of cell in
-        puzzle with fewest remaining candidate values.
+        puzzle with fewest remaining candidate values. If counts, the Counts
+        of puzzle (see candidate_counts()), is given, the cell is looked up
+        in them instead.
         """
         if puzzle is None:
             puzzle = self.puzzle
+        if counts is not None:
+            return counts.fewest_candidates()
             
         fewest = -1
         for i in range(self.size**2):
@@ -134,147 +287,117 @@ class Sudoku:
         return fewest
 
 
-    def fewest_positions(self, puzzle=None):
+    def fewest_positions(self, puzzle=None, counts=None):
         """ helper function for solve_all(). returns the candidate value with
         the fewest possible positions in a given set (row, column, or box) and
-        the indices of that set. """
+        the indices of that set.
+
+        If counts, the Counts of puzzle (see candidate_counts()), is given,
+        the fewest is looked up in them and only the set holding it is
+        scanned; the answer is the same, ties included. """
         if puzzle is None:
             puzzle = self.puzzle
 
+        if counts is not None:
+            positions = counts.positions
+            """ the first set with the fewest positions, then the first value
+            met in it, visiting cells in order and candidates in ascending
+            order, as the scan below does """
+            fewest = min(filter(None, positions), default=0)
+            if fewest:
+                unit = positions.index(fewest) // self.size
+                offset = unit * self.size - 1
+                indices = self.topology.units[unit]
+                for j in indices:
+                    if isinstance(puzzle[j], int):
+                        continue
+                    for candidate in puzzle[j]:
+                        if positions[offset + VALUES[candidate]] == fewest:
+                            return candidate, [
+                                k for k in indices
+                                if not isinstance(puzzle[k], int)
+                                and candidate in puzzle[k]]
+            return '', list(range(self.size**2))
+
         fpp_candidate = ''
         fpp_positions = list(range(self.size**2))
         
-        # find value with fewest candidate positions by column
-        d = {}
-        for col in range(0, self.size):
-            for i in range(0, self.size**2, self.size):
-                j = i + col
-                if isinstance(puzzle[j], int):
-                    continue
-    
-                for candidate in puzzle[j]:
-                    if candidate in d:
-                        d[candidate].append(j)
-                    else:
-                        d[candidate] = [j]
-
+        # find value with fewest candidate positions by column, then by row,
+        # then by box
+        for unit in self.topology.units:
+            d = unit_positions(puzzle, unit)
             for candidate in d:
                 if len(d[candidate]) < len(fpp_positions):
                     fpp_candidate = candidate
                     fpp_positions = d[candidate]
-                
-            d = {}
-            
-        # now by row
-        d = {}
-        for row in range(0, self.size**2, self.size):
-            for i in range(0, self.size):
-                j = i + row
-                if isinstance(puzzle[j], int):
-                    continue
-                
-                for candidate in puzzle[j]:
-                    if candidate in d:
-                        d[candidate].append(j)
-                    else:
-                        d[candidate] = [j]
 
-            for candidate in d:
-                if len(d[candidate]) < len(fpp_positions):
-                    fpp_candidate = candidate
-                    fpp_positions = d[candidate]
-   
-            d = {}
-            
-        # now by box
-        d = {}
-        i = 0
-        while i < self.size**2:
-            # traverse across boxes, where i is the index of the top-left cell
-            for j in range(0, self.size * self.box_size, self.size):
-                for k in range (0, self.box_size):
-                    # traverse within each box
-                    index = i + j + k
-                    if isinstance(puzzle[index], int):
-                        continue
-                    
-                    for candidate in puzzle[index]:
-                        if candidate in d:
-                            d[candidate].append(index)
-                        else:
-                            d[candidate] = [index]
-                            
-            # entire box checked; process and clear dictionary
-            for candidate in d:
-                if len(d[candidate]) < len(fpp_positions):
-                    fpp_candidate = candidate
-                    fpp_positions = d[candidate]
+        return fpp_candidate, fpp_positions
 
-            d = {}
 
-            # increment counter for next box
-            i += self.box_size
-            if i % self.size == 0:
-                """ we have finished the boxes in this row of the puzzle (e.g.,
-                boxes 1, 2, and 3 in a 9x9 Sudoku); so increment i further to
-                set it to the top-left cell of the next box (e.g., box 4) """
-                i += self.size * (self.box_size - 1)
-        
-        return fpp_candidate, fpp_positions
+    @classmethod
+    def from_record(cls, record, label=None, engine='backtrack',
+                    propagation=False, cache=None, stats=None):
+        """ returns a new sudoku for the given Record (see record.py), with
+        its givens, solution, and difficulty, without solving it again; the
+        remaining arguments are as in __init__(). Records keep no branch
+        factors, so branch_factors is empty, and the solutions of a puzzle
+        that is not uniquely solvable are not known, so solutions is too.
+        """
+        sudoku = cls(record.size, label, record.givens, engine, propagation,
+                     cache, stats, solve=False)
+        if record.solved:
+            sudoku.solutions = [record.solution]
+        sudoku.difficulty = record.difficulty
+        return sudoku
 
 
-    def insert(self, value, index, puzzle=None):
+    def insert(self, value, index, puzzle=None, trail=None, counts=None):
         """ inserts given value into given cell of Sudoku puzzle, and removes
         that value from the candidates list of all neighboring cells. Helper
-        function for __init__(), make(), generate(), and solve_all(). """
+        function for __init__(), make(), generate(), and solve_all(). If a
+        trail (list) is given, the (index, old value) of every changed cell
+        is appended to it, so the insert can be reversed with undo(). If
+        counts (see candidate_counts()) is given, they are kept up to date.
+        """
         if puzzle is None:
             puzzle = self.puzzle
             
-        row = index // self.size
-        col = index % self.size            
-        box_r = row - (row % self.box_size)
-        box_c = col - (col % self.box_size)
-
-        # step one: remove value from candidates elsewhere in box
-        # cell in top-left corner of relevant box
-        top_left = box_r * int(math.sqrt(len(puzzle))) + box_c
-        # now traverse all cells in box
-        for i in range(0, self.size * self.box_size, self.size):
-            for j in range(top_left + i, top_left + i + self.box_size):
-                if isinstance(puzzle[j], int):
-                    continue
-                if value in puzzle[j]:
-                    puzzle[j] = puzzle[j].replace(value, '')
-
-        # step two: remove from candidates elsewhere in column
-        for i in range(0, self.size**2, self.size):
-            j = i + col
-            if isinstance(puzzle[j], int):
-                continue
-            if value in puzzle[j]:
-                puzzle[j] = puzzle[j].replace(value, '')
-
-        # step three: remove from candidates elsewhere in row
-        row_index = row * self.size
-        for i in range(0, self.size):
-            j = row_index + i
+        # step one: remove value from candidates elsewhere in row, column,
+        # and box
+        for j in self.topology.peers[index]:
             if isinstance(puzzle[j], int):
                 continue
             if value in puzzle[j]:
+                if trail is not None:
+                    trail.append((j, puzzle[j]))
                 puzzle[j] = puzzle[j].replace(value, '')
-
-        # step four: insert value
-        puzzle[index] = int(value)
-
-
-    def is_complete(self, puzzle=None):
+                if counts is not None:
+                    # cell j moves down a bucket
+                    counts.buckets[len(puzzle[j]) + 1].discard(j)
+                    counts.buckets[len(puzzle[j])].add(j)
+                    offset = VALUES[value] - 1
+                    for u in self.topology.units_of[j]:
+                        counts.positions[u * self.size + offset] -= 1
+
+        # step two: insert value
+        if trail is not None:
+            trail.append((index, puzzle[index]))
+        if counts is not None:
+            self._recount(counts, index, puzzle[index], VALUES[value])
+        puzzle[index] = VALUES[value]
+
+
+    def is_complete(self, puzzle=None, counts=None):
         """ checks whether any cells have not been solved. Cells with
         candidates remaining (i.e., a non-empty string) or cells with no valid
         solution (i.e., an empty string) cause it to return False. Otherwise,
-        the puzzle is complete and the function returns True.
+        the puzzle is complete and the function returns True. If counts (see
+        candidate_counts()) is given, their count of unsolved cells is used.
         """
         if puzzle is None:
             puzzle = self.puzzle
+        if counts is not None:
+            return counts.unsolved == 0
             
         for i in range(self.size**2):
             if not isinstance(puzzle[i], int):
@@ -282,99 +405,70 @@ class Sudoku:
         return True
 
 
-    def make(self):
-        """ fills the first three boxes and first column of a blank grid, then
-        uses generate() to generate a final puzzle """
+    def is_solved(self, cell):
+        """ returns True if the given cell value is a solution rather than a
+        set of candidates. """
+        return isinstance(cell, int)
 
-        # step zero: initialize puzzle with all candidates
-        for i in range(self.size**2):
-            self.puzzle.append(self.candidates)
-
-        # step one: fill box 1
-        # traverse by row and col the cells within the first box
-        top_left_index = 0
-        row_index_delta = self.size
-        row_beyond_box_index = self.size * self.box_size
-        for i in range(top_left_index, row_beyond_box_index, row_index_delta):
-            # create random sequence of candidates for row
-            values = random.sample(list(self.puzzle[i]), len(self.puzzle[i]))        
-            for j in range(i, i + self.box_size):
-                # pull random value and assign to cell
-                candidate = values.pop()
-                self.insert(candidate, j)
-
-        # step two: fill box 2
-        # traverse by row and col the cells within the second box
-        top_left_index += self.box_size
-        row_beyond_box_index += self.box_size
-        for i in range(top_left_index, row_beyond_box_index, row_index_delta):
-            # create random sequence of candidates for row
-            values = random.sample(list(self.puzzle[i]), len(self.puzzle[i]))
-            for j in range(i, i + self.box_size):
-                row = j // self.size
-                if row < self.box_size - 1:
-                    """ we're not on last row, so only pick a value for the
-                    cell that won't make last row unsolvable. """
-                    brc = self.size * (self.box_size - 1) + self.box_size
-                    
-                    for v in values:
-                        """ temporarily remove v from candidates for cell in
-                        bottom-right corner of the current/second box """
-                        brc_wo_v = self.puzzle[brc].replace(v, '')
-                        if len(brc_wo_v) >= self.box_size:
-                            # bottom row of box will still be solvable
-                            candidate = v
-                            values.remove(v)
-                            break
-                else:
-                    # in last row of box; simply pick value and fill
-                    candidate = values.pop()
-
-                self.insert(candidate, j)
-
-        # step three: fill box 3
-        # traverse by row and col the cells within third box
-        top_left_index += self.box_size
-        row_beyond_box_index += self.box_size
-        for i in range(top_left_index, row_beyond_box_index, row_index_delta):
-            # create random sequence of candidates for row
-            values = random.sample(list(self.puzzle[i]), len(self.puzzle[i]))
-            for j in range(i, i + self.box_size):
-                candidate = values.pop()
-                self.insert(candidate, j)
-
-        # step four: fill column 1
-        # traverse first col of entire puzzle, starting below first box
-        top_left_index = self.size * self.box_size
-        row_beyond_puzzle_index = self.size**2
-        for i in range(top_left_index, row_beyond_puzzle_index,
-                       row_index_delta):
-            values = random.sample(list(self.puzzle[i]), len(self.puzzle[i]))
-            candidate = values.pop()
-            self.insert(candidate, i)
-
-        # step five: generate puzzle
-        self.generate()
+
+    def make(self):
+        """ makes a new, uniquely solvable puzzle from scratch: a random grid
+        from random_grid(), with clues removed as in generate() until no more
+        can be, is set as the puzzle, which is then solved and scored.
+
+        At 16x16, a few of the uniqueness checks take most of the time
+        (seconds each), so above 9x9 each is given up after size**2 nodes
+        and its clue kept; the puzzle is still unique, but may not be
+        minimal. A 16x16 puzzle then takes about half a second to make. """
+        solution = random_grid(self.size)
+        order = random.sample(range(self.size**2), self.size**2)
+        givens = []
+        _remove_clues(sudoku_cover(self.size), self.size, solution, order,
+                      0, len(order), givens, lambda: True,
+                      self.size**2 if self.size > 9 else None)
+
+        self.puzzle = [self.blank() for i in range(self.size**2)]
+        for i in givens:
+            self.insert(SYMBOLS[solution[i] - 1], i)
+        self.solve(report=False)
+
+
+    def _pack_cell(self, cell):
+        # helper function for pickling a search; returns the given cell
+        # value as an int, as BitmaskSudoku stores it
+        if isinstance(cell, int):
+            return cell
+        mask = 0
+        for candidate in cell:
+            mask |= 1 << (VALUES[candidate] - 1)
+        return ~mask
+
+
+    def _pack_value(self, value):
+        # helper function for pickling a search; returns the given value, as
+        # insert() accepts it, as an int
+        return VALUES[value]
 
 
     def print(self, puzzle=None):
         if puzzle is None:
             puzzle = self.puzzle
             
+        bar = '-' * (2 * (self.size + self.box_size) + 1)
         res = self.label + ':\n'
         for i in range(self.size**2):
             row = i // self.size
             col = i % self.size
             if row % self.box_size == 0 and col == 0:
                 # starting a new row; print horizontal bar
-                res += '-------------------------\n'
+                res += bar + '\n'
             if col % self.box_size == 0:
                 # entered a new box; print vertical bar
                 res += '| '
 
             if isinstance(puzzle[i], int):
                 # cell has determinate value
-                res += str(puzzle[i]) + ' '
+                res += SYMBOLS[puzzle[i] - 1] + ' '
             elif len(puzzle[i]) >= 1:
                 # cell has multiple candidates
                 res += '0 '
@@ -385,33 +479,112 @@ class Sudoku:
             if col == self.size - 1:
                 # hit right edge of puzzle; move to next line
                 res += '|\n'
-        res += '-------------------------'
+        res += bar
         return res
 
 
-    def remove(self, index, puzzle=None):
+    def propagate(self, puzzle=None, trail=None, counts=None):
+        """ applies naked and hidden singles and pairs to puzzle until none
+        of them makes progress (see propagation.py), and adds the candidates
+        each rule eliminated to self.eliminations. Returns the number of
+        candidates eliminated, or None if the puzzle is unsolvable. Helper
+        function for solve_all() and solve_trail(); trail and counts work as
+        in insert(). """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        if counts is not None:
+            # the rules don't know about counts; recount the cells they
+            # changed afterwards, from the trail
+            if trail is None:
+                trail = []
+            mark = len(trail)
+
+        made = dict.fromkeys(RULES, 0)
+        res = self._tally(self._propagate(puzzle, made, trail), made)
+
+        if counts is not None:
+            old = {}
+            for index, value in trail[mark:]:
+                old.setdefault(index, value)
+            for index in old:
+                self._recount(counts, index, old[index], puzzle[index])
+        return res
+
+
+    def _propagate(self, puzzle, made, trail):
+        # helper function for propagate(); applies the rules, counting their
+        # eliminations in made
+        return propagate(puzzle, made, trail)
+
+
+    def _recount(self, counts, index, old, new):
+        # helper function for insert() and the like; updates counts for cell
+        # index changing from old to new
+        if isinstance(old, int):
+            counts.unsolved += 1
+            # a solved cell counts as one without candidates below
+            old = ''
+        else:
+            counts.buckets[len(old)].discard(index)
+        if isinstance(new, int):
+            counts.unsolved -= 1
+            new = ''
+        else:
+            counts.buckets[len(new)].add(index)
+
+        # (value, change in count) of every candidate gained or lost
+        changes = ([(VALUES[c], -1) for c in old if c not in new]
+                   + [(VALUES[c], 1) for c in new if c not in old])
+        positions = counts.positions
+        for u in self.topology.units_of[index]:
+            offset = u * self.size - 1
+            for value, change in changes:
+                positions[offset + value] += change
+
+
+    def remove(self, index, puzzle=None, counts=None):
         """ removes value from given cell (index) of Sudoku puzzle, and stores
         all candidate values in that cell that are not already used in this
-        cell's row, column, or box. Helper function for generate(). """
+        cell's row, column, or box. Helper function for generate(). counts
+        work as in insert(). """
         if puzzle is None:
             puzzle = self.puzzle
 
         if not isinstance(puzzle[index], int):
             # cell is not solved; nothing to remove
             return
+        old = puzzle[index]
 
         # step one: load all candidates into cell
-        puzzle[index] = self.candidates
+        puzzle[index] = self.blank()
 
         # step two: remove candidates already used elsewhere
-        row = index // self.size
-        col = index % self.size
+        row = self.topology.row_of[index]
+        col = self.topology.col_of[index]
         for candidate in puzzle[index]:
             if (self.used_in_row(row, candidate, puzzle) or
                 self.used_in_col(col, candidate, puzzle) or
                 self.used_in_box(row, col, candidate, puzzle)):
                 puzzle[index] = puzzle[index].replace(candidate, '')
 
+        if counts is not None:
+            self._recount(counts, index, old, puzzle[index])
+
+
+    def report(self, report=True):
+        """ helper function for solve(). prints the result of the last
+        solve, if report is True. """
+        if report:
+            if len(self.solutions) == 0:
+                print("No solution could be found.")
+            elif len(self.solutions) == 1:
+                print("Unique solution: ")
+                print(self.print(self.solutions[0]))
+                print("Difficulty score:", self.difficulty)
+            else:
+                print("Multiple possible solutions found.")
+
 
     def score(self, puzzle=None):
         if puzzle is None:
@@ -427,7 +600,7 @@ class Sudoku:
             # step two: fetch number of empty cells in given puzzle
             empty_cells = 0
             for i in range(len(puzzle)):
-                if not isinstance(puzzle[i], int):
+                if not self.is_solved(puzzle[i]):
                     empty_cells += 1
                     
     ##        print("branch_factors:", self.branch_factors)
@@ -439,36 +612,66 @@ class Sudoku:
             self.difficulty = B * 100 + empty_cells
         else:
             # no unique solution found
-            self.difficulty = np.NaN
+            self.difficulty = math.nan
             
         return self.difficulty
 
 
+    def search(self, puzzle=None):
+        """ returns a Search (see search.py) that solves the given puzzle
+        like solve_trail(), but without recursion, and can be run in steps
+        with a node or time budget. Solutions and branch factors are added
+        to self.solutions and self.branch_factors as it runs; clear them
+        first, as solve() does, to start afresh. """
+        return Search(self, puzzle)
+
+
     def solve(self, puzzle=None, report=True):
-        """ calls solve_all() to generate solution(s), scores unique solution
-        if found, and (optionally) prints the resultant solution """
+        """ calls solve_all(), solve_dlx(), solve_trail(), or runs search(),
+        depending on self.engine, to
+        generate solution(s), scores unique solution if found, and
+        (optionally) prints the resultant solution """
 
         # first, clear values in solutions list
         self.solutions = []
         self.branch_factors = []
-
-        self.solve_all(puzzle)
+        self.eliminations = dict.fromkeys(RULES, 0)
+
+        if self.cache is not None:
+            key = self.cache_key(puzzle)
+            entry = self.cache.get(key)
+            if entry is not None:
+                # solved before; skip the search
+                self.solutions = entry['solutions']
+                self.branch_factors = entry['branch_factors']
+                self.difficulty = entry['difficulty']
+                self.eliminations.update(entry.get('eliminations', {}))
+                self.report(report)
+                return
+
+        if self.engine == 'dlx':
+            self.solve_dlx(puzzle)
+        elif self.engine == 'trail':
+            self.solve_trail(puzzle)
+        elif self.engine == 'iterative':
+            self.search(puzzle).run()
+        else:
+            self.solve_all(puzzle)
         self.score(puzzle)
 
-        if report:
-            if len(self.solutions) == 0:
-                print("No solution could be found.")
-            elif len(self.solutions) == 1:
-                print("Unique solution: ")
-                print(self.print(self.solutions[0]))
-                print("Difficulty score:", self.difficulty)
-            else:
-                print("Multiple possible solutions found.")
+        if self.cache is not None:
+            self.cache.put(key, {'solutions': self.solutions,
+                                 'count': len(self.solutions),
+                                 'branch_factors': self.branch_factors,
+                                 'difficulty': self.difficulty,
+                                 'eliminations': self.eliminations})
+
+        self.report(report)
 
 
     # TODO: check to ensure given puzzle is valid; e.g., solve_all() currently
     # ignores the fact that the puzzle has two 1s in the top row
-    def solve_all(self, puzzle=None):
+    def solve_all(self, puzzle=None, counts=None):
         """ solver function that utilizes backtracking, randomization, and
         optimization. Returns solved puzzle, or None if given puzzle is
         unsolvable. Stores found solutions in self.solutions list.
@@ -476,31 +679,55 @@ class Sudoku:
         The optimization is that this solver does not traverse all cells in
         order (from 0 to 80 in a 9x9 puzzle, for example). Instead, it picks
         the cell with the fewest remaining candidates, or the set and value
-        with the fewest possible positions, whichever is smaller.
+        with the fewest possible positions, whichever is smaller. If
+        self.propagation is set, propagate() is run to a fixed point before
+        each branch. counts, the Counts of puzzle, are built with
+        candidate_counts() if not given, and copied along with the puzzle.
         """
         if puzzle is None:
             puzzle = self.puzzle[:]
+        if counts is None:
+            counts = self.candidate_counts(puzzle)
+        stats = self.stats
+        if stats is not None:
+            stats.enter(puzzle)
+
+        # whether propagate() has nothing left to do on puzzle
+        fixed_point = False
             
-        while not self.is_complete(puzzle):
-            i = self.fewest_candidates(puzzle)
+        while not self.is_complete(puzzle, counts):
+            i = (self.fewest_candidates(puzzle, counts) if stats is None else
+                 stats.call('fewest_candidates', self.fewest_candidates,
+                            puzzle, counts))
             # fewest_candidates() skips solved cells                
  
             if len(puzzle[i]) == 1:
                 # all candidates but one have been eliminated; officially
                 # solve cell with insert()
-                self.insert(puzzle[i], i, puzzle)
+                self.insert(puzzle[i], i, puzzle, counts=counts)
                 continue
             if len(puzzle[i]) == 0:
                 # cell has no possible solutions; puzzle unsolvable
                 return None
             if len(puzzle[i]) > 1:
                 # cell has more than one candidate
+                if self.propagation and not fixed_point:
+                    eliminated = self.propagate(puzzle, counts=counts)
+                    if eliminated is None:
+                        # propagation found puzzle unsolvable
+                        return None
+                    fixed_point = True
+                    if eliminated:
+                        # pick cell again from the reduced puzzle
+                        continue
 
                 search_set = []
                 """ find value with fewest possible remaining positions in
                 some set (row, column, or box) """
                 fpp_value, fpp_positions = (
-                    self.fewest_positions(puzzle))
+                    self.fewest_positions(puzzle, counts) if stats is None
+                    else stats.call('fewest_positions', self.fewest_positions,
+                                    puzzle, counts))
                 
                 if len(fpp_positions) < len(puzzle[i]):
                     # value-set is more promising than current cell
@@ -518,12 +745,18 @@ class Sudoku:
 
                 for candidate, position in search_set:
                     puzzle_copy = puzzle[:]
+                    counts_copy = counts.copy()
 
-                    self.insert(candidate, position, puzzle_copy)
+                    self.insert(candidate, position, puzzle_copy,
+                                counts=counts_copy)
 
                     # recurse on copy and mark branching
                     branches += 1
-                    puzzle_copy = self.solve_all(puzzle_copy)
+                    if stats is not None:
+                        stats.branch(copied=True)
+                    puzzle_copy = self.solve_all(puzzle_copy, counts_copy)
+                    if stats is not None:
+                        stats.unbranch(puzzle_copy is not None)
 
                     # check that we haven't found more than one solution
                     if (len(self.solutions) >= 2
@@ -536,36 +769,224 @@ class Sudoku:
                 return None
             
         # puzzle is complete; store it in solutions and score
+        if stats is not None:
+            stats.solved(puzzle)
         if puzzle not in self.solutions:
             self.solutions.append(puzzle)
             
         return puzzle
 
 
+    def solve_dlx(self, puzzle=None, limit=2):
+        """ solver function that models the puzzle as an exact cover problem
+        and solves it with Knuth's dancing links (see dlx.py). Stores found
+        solutions, up to the given limit, in self.solutions and returns how
+        many were found. The default limit of 2 is enough for solve() and
+        score() to tell whether the solution is unique.
+
+        Only solved cells of puzzle are used as givens. Like solve_all(), each
+        search node that is exhausted appends the number of branches it tried
+        to self.branch_factors, so score() works the same on either engine.
+        Unlike solve_all(), givens that contradict each other (e.g., two 1s
+        in the top row) are caught, and the puzzle has no solutions.
+        """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        cover = sudoku_cover(self.size)
+        givens = []
+        for i in range(len(puzzle)):
+            if self.is_solved(puzzle[i]):
+                givens.append(i * self.size + puzzle[i] - 1)
+                if not cover.select(givens[-1]):
+                    # value already used in cell's row, column, or box
+                    return 0
+
+        found = cover.search(limit)
+        self.branch_factors += cover.branch_factors
+        if self.stats is not None:
+            self.stats.nodes += cover.nodes
+            self.stats.solutions += found
+
+        for rows in cover.solutions:
+            solution = [0] * len(puzzle)
+            for r in givens + rows:
+                solution[r // self.size] = r % self.size + 1
+            if solution not in self.solutions:
+                self.solutions.append(solution)
+
+        return found
+
+
+    def solve_trail(self, puzzle=None, trail=None, counts=None):
+        """ solve_all() without copies. Makes the same search, and stores
+        solutions and branch factors the same way, but changes a single
+        puzzle in place: every change insert() and propagate() make is
+        recorded on trail, and each branch is reversed with undo() before
+        the next is tried. Memory use therefore does not grow with the
+        number of branches, only with the number of changes in progress.
+        counts are kept up to date the same way, and built as in
+        solve_all() if not given. Returns a solved copy of the puzzle, or
+        None.
+
+        It is not the faster engine: undoing a change costs about as much as
+        making it, while solve_all()'s copies of a 9x9 puzzle and its counts
+        are cheap. On the benchmark corpus it takes about 1.35-1.55 times as
+        long as solve_all() without propagation, and about as long with it,
+        where propagate() dominates.
+        """
+        if puzzle is None:
+            puzzle = self.puzzle[:]
+        if trail is None:
+            trail = []
+        if counts is None:
+            counts = self.candidate_counts(puzzle)
+        stats = self.stats
+        if stats is not None:
+            stats.enter(puzzle)
+
+        # whether propagate() has nothing left to do on puzzle
+        fixed_point = False
+
+        while not self.is_complete(puzzle, counts):
+            i = (self.fewest_candidates(puzzle, counts) if stats is None else
+                 stats.call('fewest_candidates', self.fewest_candidates,
+                            puzzle, counts))
+            candidates = self.cell_candidates(puzzle[i])
+
+            if len(candidates) == 1:
+                self.insert(candidates[0], i, puzzle, trail, counts)
+                continue
+            if len(candidates) == 0:
+                return None
+
+            if self.propagation and not fixed_point:
+                eliminated = self.propagate(puzzle, trail, counts)
+                if eliminated is None:
+                    return None
+                fixed_point = True
+                if eliminated:
+                    continue
+
+            search_set = []
+            fpp_value, fpp_positions = (
+                self.fewest_positions(puzzle, counts) if stats is None else
+                stats.call('fewest_positions', self.fewest_positions, puzzle,
+                           counts))
+
+            if len(fpp_positions) < len(candidates):
+                for position in fpp_positions:
+                    search_set.append((fpp_value, position))
+            else:
+                for candidate in random.sample(candidates, len(candidates)):
+                    search_set.append((candidate, i))
+
+            branches = 0
+
+            for candidate, position in search_set:
+                # changes past mark belong to this branch
+                mark = len(trail)
+                self.insert(candidate, position, puzzle, trail, counts)
+
+                branches += 1
+                if stats is not None:
+                    stats.branch()
+                solution = self.solve_trail(puzzle, trail, counts)
+                if stats is not None:
+                    stats.unbranch(solution is not None)
+                self.undo(puzzle, trail, mark, counts)
+
+                if len(self.solutions) >= 2 and solution is not None:
+                    return solution
+
+            self.branch_factors.append(branches)
+            return None
+
+        # puzzle is complete; store a copy, since the caller will undo it
+        solution = puzzle[:]
+        if stats is not None:
+            stats.solved(solution)
+        if solution not in self.solutions:
+            self.solutions.append(solution)
+
+        return solution
+
+
+    def _tally(self, res, made):
+        # helper function for propagate(); adds made, the eliminations of
+        # each rule, to self.eliminations and to self.stats
+        for rule in made:
+            self.eliminations[rule] += made[rule]
+        if self.stats is not None:
+            self.stats.propagated(made)
+        return res
+
+
+    def to_record(self, puzzle=None):
+        """ returns a Record (see record.py) of the given puzzle: its givens
+        (solved cells), the unique solution found by the last solve, if
+        any, and the difficulty. """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        givens = [cell if self.is_solved(cell) else 0 for cell in puzzle]
+        solution = self.solutions[0] if len(self.solutions) == 1 else None
+        return Record(givens, solution, self.difficulty)
+
+
+    def undo(self, puzzle, trail, mark=0, counts=None):
+        """ reverses the changes recorded on trail until only mark of them
+        are left. Helper function for solve_trail(). counts work as in
+        insert(), but are updated once per changed cell, from its value now
+        to its value at mark, rather than once per change: a branch often
+        changes the same cell several times. """
+        if counts is None:
+            while len(trail) > mark:
+                index, value = trail.pop()
+                puzzle[index] = value
+            return
+
+        # value of every changed cell at mark; its oldest change wins
+        restored = {}
+        for index, value in reversed(trail[mark:]):
+            restored[index] = value
+        del trail[mark:]
+        for index, value in restored.items():
+            self._recount(counts, index, puzzle[index], value)
+            puzzle[index] = value
+
+
+    def _unpack_cell(self, cell):
+        # helper function for unpickling a search; reverses _pack_cell()
+        if cell > 0:
+            return cell
+        return ''.join(SYMBOLS[v] for v in range(self.size) if ~cell >> v & 1)
+
+
+    def _unpack_value(self, value):
+        # helper function for unpickling a search; reverses _pack_value()
+        return SYMBOLS[value - 1]
+
+
     def used_in_box(self, row, col, candidate, puzzle=None):
         if puzzle is None:
             puzzle = self.puzzle
-            
-        # row and col values for cell in top-left corner of relevant box
-        box_r = row - (row % self.box_size)
-        box_c = col - (col % self.box_size)
-        # cell in top-left corner of relevant box
-        top_left = box_r * self.size + box_c
-        # now traverse all cells in box
-        for i in range(0, self.size * self.box_size, self.size):
-            for j in range(top_left + i, top_left + i + self.box_size):
-                if puzzle[j] == int(candidate):
-                    return True
+
+        value = VALUES[candidate]
+        box = self.topology.box_of[row * self.size + col]
+        for j in self.topology.boxes[box]:
+            if puzzle[j] == value:
+                return True
         return False
 
 
     def used_in_col(self, col, candidate, puzzle=None):
         if puzzle is None:
             puzzle = self.puzzle
-            
-        for i in range(0, self.size**2, self.size):
-            j = i + col
-            if puzzle[j] == int(candidate):
+
+        value = VALUES[candidate]
+        for j in self.topology.cols[col]:
+            if puzzle[j] == value:
                 return True
         return False
 
@@ -573,15 +994,727 @@ class Sudoku:
     def used_in_row(self, row, candidate, puzzle=None):
         if puzzle is None:
             puzzle = self.puzzle
-            
-        row_index = row * self.size
-        for i in range(0, self.size):
-            j = row_index + i
-            if puzzle[j] == int(candidate):
+
+        value = VALUES[candidate]
+        for j in self.topology.rows[row]:
+            if puzzle[j] == value:
                 return True
         return False
 
 
+class BitmaskSudoku(Sudoku):
+    """ represents a Sudoku puzzle whose unsolved cells store their candidates
+    as a bitmask instead of a string.
+
+    The puzzle is still a flat list of ints, one per cell, in the same order
+    as Sudoku.puzzle. The sign of each element is the solved marker:
+        - a solved cell holds its (positive) integer value, exactly as in
+          Sudoku.puzzle, so solutions of both engines compare equal;
+        - an unsolved cell holds the bitwise complement (~) of its candidate
+          mask, where bit (v - 1) is set if v is still a candidate. An
+          unsolved cell is therefore always negative, and a cell with no
+          candidates left (i.e., an unsolvable puzzle) holds ~0 == -1.
+    Eliminating a candidate is a single bitwise or on the complemented mask,
+    so insert() never allocates a new string for a neighbor.
+    """
+
+    def __init__(self, size=9, label=None, puzzle=[],
+                 engine='backtrack', propagation=False, cache=None,
+                 stats=None, solve=True):
+        # mask with a bit set for every candidate value
+        self.all_mask = (1 << size) - 1
+        super().__init__(size, label, puzzle, engine, propagation, cache,
+                         stats, solve)
+
+
+    def blank(self):
+        return ~self.all_mask
+
+
+    def cell_candidates(self, cell):
+        return [v + 1 for v in range(self.size) if ~cell >> v & 1]
+
+
+    def fewest_candidates(self, puzzle=None, counts=None):
+        """ bitmask version of Sudoku.fewest_candidates(). """
+        if puzzle is None:
+            puzzle = self.puzzle
+        if counts is not None:
+            return counts.fewest_candidates()
+
+        fewest = -1
+        fewest_count = self.size + 1
+        for i in range(self.size**2):
+            cell = puzzle[i]
+            if cell > 0:
+                # cell is solved; skip it
+                continue
+            count = (~cell).bit_count()
+            if count <= 1:
+                # cell has only one candidate, or is unsolvable
+                return i
+            if count < fewest_count:
+                fewest = i
+                fewest_count = count
+        return fewest
+
+
+    def fewest_positions(self, puzzle=None, counts=None):
+        """ bitmask version of Sudoku.fewest_positions(). Sets are scanned in
+        the same order (columns, rows, then boxes) and ties are broken the
+        same way, so both engines pick the same value and set. The value is
+        returned as an int rather than a string. """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        if counts is not None:
+            positions = counts.positions
+            fewest = min(filter(None, positions), default=0)
+            if fewest:
+                unit = positions.index(fewest) // self.size
+                offset = unit * self.size - 1
+                indices = self.topology.units[unit]
+                for j in indices:
+                    if puzzle[j] > 0:
+                        continue
+                    mask = ~puzzle[j]
+                    while mask:
+                        bit = mask & -mask
+                        mask ^= bit
+                        value = bit.bit_length()
+                        if positions[offset + value] == fewest:
+                            return value, [k for k in indices
+                                           if puzzle[k] < 0
+                                           and ~puzzle[k] & bit]
+            return 0, list(range(self.size**2))
+
+        fpp_candidate = 0
+        fpp_positions = list(range(self.size**2))
+
+        # candidate mask of every cell; solved cells have none
+        masks = [~cell if cell < 0 else 0 for cell in puzzle]
+        # number of bit planes needed to count up to size positions
+        num_planes = self.size.bit_length()
+
+        for indices in self.topology.units:
+            """ count the positions of every value in the set at once: bit v
+            of planes[p] holds bit p of the number of positions of value
+            v + 1, so adding a cell's mask is a ripple-carry addition """
+            planes = [0] * num_planes
+            for j in indices:
+                carry = masks[j]
+                p = 0
+                while carry:
+                    planes[p], carry = planes[p] ^ carry, planes[p] & carry
+                    p += 1
+
+            # look for values with k positions, for each k that would beat
+            # the best set found so far
+            for k in range(1, min(len(fpp_positions), self.size + 1)):
+                found = self.all_mask
+                for p in range(num_planes):
+                    if k >> p & 1:
+                        found &= planes[p]
+                    else:
+                        found &= ~planes[p]
+                if not found:
+                    continue
+
+                """ Sudoku.fewest_positions() keeps the first value it meets
+                with the fewest positions, visiting cells in order and
+                values within a cell in ascending order; so of the values
+                found, keep the one in the earliest cell """
+                while found:
+                    bit = found & -found
+                    found ^= bit
+                    positions = [j for j in indices if masks[j] & bit]
+                    if (len(fpp_positions) > k
+                        or positions[0] < fpp_positions[0]):
+                        fpp_candidate = bit.bit_length()
+                        fpp_positions = positions
+                break
+
+        return fpp_candidate, fpp_positions
+
+
+    def insert(self, value, index, puzzle=None, trail=None, counts=None):
+        """ bitmask version of Sudoku.insert(). value may be given as an int
+        or a candidate character, as in Sudoku. """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        if isinstance(value, str):
+            value = VALUES[value]
+        bit = 1 << (value - 1)
+
+        # solved cells are positive and skipped, and or-ing the bit into a
+        # complemented mask clears the candidate
+        if trail is None and counts is None:
+            for j in self.topology.peers[index]:
+                if puzzle[j] < 0:
+                    puzzle[j] |= bit
+        else:
+            units_of = self.topology.units_of
+            size = self.size
+            for j in self.topology.peers[index]:
+                if puzzle[j] < 0 and not puzzle[j] & bit:
+                    if trail is not None:
+                        trail.append((j, puzzle[j]))
+                    puzzle[j] |= bit
+                    if counts is not None:
+                        k = (~puzzle[j]).bit_count()
+                        counts.buckets[k + 1].discard(j)
+                        counts.buckets[k].add(j)
+                        for u in units_of[j]:
+                            counts.positions[u * size + value - 1] -= 1
+            if trail is not None:
+                trail.append((index, puzzle[index]))
+            if counts is not None:
+                self._recount(counts, index, puzzle[index], value)
+
+        puzzle[index] = value
+
+
+    def is_complete(self, puzzle=None, counts=None):
+        if puzzle is None:
+            puzzle = self.puzzle
+        if counts is not None:
+            return counts.unsolved == 0
+
+        for cell in puzzle:
+            if cell < 0:
+                return False
+        return True
+
+
+    def is_solved(self, cell):
+        return cell > 0
+
+
+    def _pack_cell(self, cell):
+        return cell
+
+
+    def _pack_value(self, value):
+        return VALUES[value] if isinstance(value, str) else value
+
+
+    def print(self, puzzle=None):
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        return super().print(self.to_strings(puzzle))
+
+
+    def _propagate(self, puzzle, made, trail):
+        # bitmask version of Sudoku._propagate(); applies the same rules in
+        # the same order as propagation.propagate()
+        peers = self.topology.peers
+        if trail is None:
+            # record changes somewhere, to keep the rules below simple
+            trail = []
+
+        def place(value_bit, index):
+            # insert() that also returns the eliminations it made
+            eliminated = 0
+            for j in peers[index]:
+                if puzzle[j] < 0 and not puzzle[j] & value_bit:
+                    trail.append((j, puzzle[j]))
+                    puzzle[j] |= value_bit
+                    eliminated += 1
+            trail.append((index, puzzle[index]))
+            puzzle[index] = value_bit.bit_length()
+            return eliminated
+
+        changed = True
+        while changed:
+            changed = False
+
+            # naked singles
+            for i in range(self.size**2):
+                if puzzle[i] > 0:
+                    continue
+                mask = ~puzzle[i]
+                if mask == 0:
+                    return None
+                if mask & (mask - 1) == 0:
+                    made['naked singles'] += place(mask, i)
+                    changed = True
+            if changed:
+                continue
+
+            # hidden singles; also catches values that can't go anywhere
+            for unit in self.topology.units:
+                placed = 0
+                once = 0
+                twice = 0
+                for j in unit:
+                    if puzzle[j] > 0:
+                        placed |= 1 << (puzzle[j] - 1)
+                    else:
+                        twice |= once & ~puzzle[j]
+                        once |= ~puzzle[j]
+                if placed | once != self.all_mask:
+                    return None
+
+                singles = once & ~twice
+                while singles:
+                    bit = singles & -singles
+                    singles ^= bit
+                    for j in unit:
+                        if puzzle[j] < 0 and ~puzzle[j] & bit:
+                            made['hidden singles'] += (
+                                (~puzzle[j]).bit_count() - 1 + place(bit, j))
+                            changed = True
+                            break
+            if changed:
+                continue
+
+            # naked pairs
+            for unit in self.topology.units:
+                pairs = {}
+                for j in unit:
+                    mask = ~puzzle[j]
+                    if puzzle[j] < 0 and mask.bit_count() == 2:
+                        pairs.setdefault(mask, []).append(j)
+
+                for pair in pairs:
+                    if len(pairs[pair]) != 2:
+                        continue
+                    for j in unit:
+                        if puzzle[j] > 0 or j in pairs[pair]:
+                            continue
+                        claimed = ~puzzle[j] & pair
+                        if claimed:
+                            made['naked pairs'] += claimed.bit_count()
+                            trail.append((j, puzzle[j]))
+                            puzzle[j] |= pair
+                            changed = True
+            if changed:
+                continue
+
+            # hidden pairs
+            for unit in self.topology.units:
+                # positions of each value with exactly two, as a pair of cells
+                by_positions = {}
+                for v in range(self.size):
+                    bit = 1 << v
+                    positions = tuple(j for j in unit
+                                      if puzzle[j] < 0 and ~puzzle[j] & bit)
+                    if len(positions) == 2:
+                        by_positions[positions] = (
+                            by_positions.get(positions, 0) | bit)
+
+                # more than two values can't all go in the same two cells
+                for pair in by_positions.values():
+                    if pair.bit_count() > 2:
+                        return None
+
+                for positions in by_positions:
+                    pair = by_positions[positions]
+                    if pair.bit_count() != 2:
+                        continue
+                    for j in positions:
+                        """ keep the pair's values; a cell in two pairs
+                        keeps only what they share, as in propagation.py """
+                        mask = ~puzzle[j]
+                        keep = mask & pair
+                        if keep != mask:
+                            made['hidden pairs'] += (mask.bit_count()
+                                                     - keep.bit_count())
+                            trail.append((j, puzzle[j]))
+                            puzzle[j] = ~keep
+                            changed = True
+
+        return sum(made.values())
+
+
+    def _recount(self, counts, index, old, new):
+        # bitmask version of Sudoku._recount()
+        if old < 0:
+            old = ~old
+            counts.buckets[old.bit_count()].discard(index)
+        else:
+            counts.unsolved += 1
+            old = 0
+        if new < 0:
+            new = ~new
+            counts.buckets[new.bit_count()].add(index)
+        else:
+            counts.unsolved -= 1
+            new = 0
+
+        # most changes gain or lose a single candidate
+        positions = counts.positions
+        units = self.topology.units_of[index]
+        size = self.size
+        changed = old ^ new
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            change = 1 if new & bit else -1
+            value = bit.bit_length() - 1
+            for u in units:
+                positions[u * size + value] += change
+
+
+    def remove(self, index, puzzle=None, counts=None):
+        """ bitmask version of Sudoku.remove(). """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        if puzzle[index] < 0:
+            # cell is not solved; nothing to remove
+            return
+        old = puzzle[index]
+
+        # load all candidates into cell, then remove those used elsewhere
+        puzzle[index] = self.blank()
+        used = 0
+        for j in self.topology.peers[index]:
+            if puzzle[j] > 0:
+                used |= 1 << (puzzle[j] - 1)
+        puzzle[index] |= used
+
+        if counts is not None:
+            self._recount(counts, index, old, puzzle[index])
+
+
+    def solve_all(self, puzzle=None, counts=None):
+        """ bitmask version of Sudoku.solve_all(). Follows the same search,
+        so solutions and branch_factors match those of the string engine. """
+        if puzzle is None:
+            puzzle = self.puzzle[:]
+        if counts is None:
+            counts = self.candidate_counts(puzzle)
+        stats = self.stats
+        if stats is not None:
+            stats.enter(puzzle)
+
+        # whether propagate() has nothing left to do on puzzle
+        fixed_point = False
+
+        while not self.is_complete(puzzle, counts):
+            i = (self.fewest_candidates(puzzle, counts) if stats is None else
+                 stats.call('fewest_candidates', self.fewest_candidates,
+                            puzzle, counts))
+            mask = ~puzzle[i]
+            count = mask.bit_count()
+
+            if count == 1:
+                # all candidates but one have been eliminated
+                self.insert(mask.bit_length(), i, puzzle, counts=counts)
+                continue
+            if count == 0:
+                # cell has no possible solutions; puzzle unsolvable
+                return None
+
+            # cell has more than one candidate
+            if self.propagation and not fixed_point:
+                eliminated = self.propagate(puzzle, counts=counts)
+                if eliminated is None:
+                    # propagation found puzzle unsolvable
+                    return None
+                fixed_point = True
+                if eliminated:
+                    # pick cell again from the reduced puzzle
+                    continue
+
+            search_set = []
+            fpp_value, fpp_positions = (
+                self.fewest_positions(puzzle, counts) if stats is None else
+                stats.call('fewest_positions', self.fewest_positions, puzzle,
+                           counts))
+
+            if len(fpp_positions) < count:
+                # value-set is more promising than current cell
+                for position in fpp_positions:
+                    search_set.append((fpp_value, position))
+            else:
+                # current cell is more promising than value-set
+                candidates = [v + 1 for v in range(self.size)
+                              if mask >> v & 1]
+                for candidate in random.sample(candidates, count):
+                    search_set.append((candidate, i))
+
+            branches = 0
+
+            for candidate, position in search_set:
+                puzzle_copy = puzzle[:]
+                counts_copy = counts.copy()
+
+                self.insert(candidate, position, puzzle_copy,
+                            counts=counts_copy)
+
+                # recurse on copy and mark branching
+                branches += 1
+                if stats is not None:
+                    stats.branch(copied=True)
+                puzzle_copy = self.solve_all(puzzle_copy, counts_copy)
+                if stats is not None:
+                    stats.unbranch(puzzle_copy is not None)
+
+                # check that we haven't found more than one solution
+                if (len(self.solutions) >= 2
+                    and puzzle_copy is not None):
+                    return puzzle_copy
+
+            # search tree is exhausted from this node
+            self.branch_factors.append(branches)
+            return None
+
+        # puzzle is complete; solved cells hold plain ints, so store as is
+        if stats is not None:
+            stats.solved(puzzle)
+        if puzzle not in self.solutions:
+            self.solutions.append(puzzle)
+
+        return puzzle
+
+
+    def to_strings(self, puzzle=None):
+        """ returns a copy of puzzle in the representation used by Sudoku, with
+        each candidate mask converted to a string of candidate characters. """
+        if puzzle is None:
+            puzzle = self.puzzle
+
+        res = []
+        for cell in puzzle:
+            if cell > 0:
+                res.append(cell)
+            else:
+                res.append(''.join(SYMBOLS[v] for v in range(self.size)
+                                   if ~cell >> v & 1))
+        return res
+
+
+    def _unpack_cell(self, cell):
+        return cell
+
+
+    def _unpack_value(self, value):
+        return value
+
+
+class Walk:
+    """ represents an in-progress random walk of generate_walks().
+
+    A walk starts from a minimal puzzle made as in generate(). Each of its
+    steps adds back one clue from the solution at random and removes others
+    until the puzzle is minimal again, giving a neighboring puzzle, which is
+    scored; the walk moves there unless it is easier. It keeps its top best
+    puzzles as (difficulty, puzzle) tuples, each puzzle a tuple of ints, 0
+    for empty cells.
+
+    run() can stop after a given number of steps, and be called again later
+    to carry on where it stopped. A stopped walk can be pickled and run on
+    from the unpickled copy, e.g. to checkpoint a long walk or to hand it
+    to another process. Its state is its own random number generator, the
+    state of the global random it solves with, the solution, the current
+    givens and score, the best puzzles so far, and the number of steps
+    taken, so a resumed walk takes the same steps as an uninterrupted one.
+    """
+
+    def __init__(self, seed, steps=100, top=10, size=9, engine='backtrack',
+                 propagation=False, cls=Sudoku):
+        self.seed = seed
+        # number of steps to take in all
+        self.steps = steps
+        # number of best puzzles to keep
+        self.top = top
+        # arguments passed on to cls when scoring
+        self.size = size
+        self.engine = engine
+        self.propagation = propagation
+        self.cls = cls
+        # random number generator for the walk's own choices
+        self.rng = random.Random(seed)
+        """ state of the global random for the walk's solves, seeded too,
+        since solve_all() branches in random order, and scores would
+        otherwise differ from run to run; run() swaps it in, and the
+        caller's back afterwards. Its seed is derived from seed, not seed
+        itself, so that it doesn't repeat the stream of rng """
+        state = random.getstate()
+        random.seed(f"{seed}:solve")
+        self.random_state = random.getstate()
+        random.setstate(state)
+        # full grid the walk's puzzles are cut from, once started
+        self.solution = None
+        # cells given in the current puzzle
+        self.givens = []
+        # (difficulty, puzzle) of the current puzzle, once started
+        self.current = None
+        # min-heap of the best (difficulty, puzzle) tuples, easiest at the top
+        self.best = []
+        # number of steps taken so far
+        self.step = 0
+
+
+    def __getstate__(self):
+        """ returns the state to pickle, packed as bytes where it can be:
+        the words of both random states, the solution, the givens (in
+        order, since the walk samples from them), and the puzzles of the
+        current and best entries. """
+        def pack(random_state):
+            version, words, gauss = random_state
+            return version, struct.pack(f'<{len(words)}I', *words), gauss
+
+        state = self.__dict__.copy()
+        state['rng'] = pack(self.rng.getstate())
+        state['random_state'] = pack(self.random_state)
+        if self.solution is not None:
+            state['solution'] = bytes(self.solution)
+        state['givens'] = struct.pack(f'<{len(self.givens)}H', *self.givens)
+        if self.current is not None:
+            state['current'] = (self.current[0], bytes(self.current[1]))
+        state['best'] = [(difficulty, bytes(puzzle))
+                         for difficulty, puzzle in self.best]
+        return state
+
+
+    def __setstate__(self, state):
+        """ restores a pickled walk; reverses __getstate__(). """
+        def unpack(packed):
+            version, words, gauss = packed
+            return version, struct.unpack(f'<{len(words) // 4}I', words), gauss
+
+        self.__dict__.update(state)
+        self.rng = random.Random()
+        self.rng.setstate(unpack(state['rng']))
+        self.random_state = unpack(state['random_state'])
+        if self.solution is not None:
+            self.solution = list(self.solution)
+        self.givens = list(struct.unpack(f'<{len(self.givens) // 2}H',
+                                         self.givens))
+        if self.current is not None:
+            self.current = (self.current[0], tuple(self.current[1]))
+        self.best = [(difficulty, tuple(puzzle))
+                     for difficulty, puzzle in self.best]
+
+
+    def run(self, max_steps=None):
+        """ runs the walk until it has taken all its steps, or until
+        max_steps more have been taken. Returns True if the walk is done, or
+        False if it stopped early; in that case run() may be called again.
+        """
+        state = random.getstate()
+        random.setstate(self.random_state)
+        try:
+            if self.current is None:
+                self._start()
+            limit = (self.steps if max_steps is None
+                     else min(self.steps, self.step + max_steps))
+            while self.step < limit:
+                self._take_step()
+                self.step += 1
+        finally:
+            self.random_state = random.getstate()
+            random.setstate(state)
+        return self.step >= self.steps
+
+
+    def _minimal(self, order):
+        """ helper function for run(). returns the cells of a minimal
+        puzzle of the walk's solution, removing clues in the given order
+        (see _remove_clues()). """
+        size = self.size
+        kept = []
+        _remove_clues(sudoku_cover(size), size, self.solution, order, 0,
+                      len(order), kept, lambda: True)
+        return kept
+
+
+    def _score(self, givens):
+        """ helper function for run(). returns (difficulty, puzzle) for the
+        puzzle with the given cells of the solution given. """
+        size = self.size
+        puzzle = [0] * size**2
+        for i in givens:
+            puzzle[i] = self.solution[i]
+        sudoku = self.cls(size=size, label=self.seed, puzzle=puzzle,
+                          engine=self.engine, propagation=self.propagation)
+        return (sudoku.difficulty, tuple(puzzle))
+
+
+    def _start(self):
+        """ helper function for run(). makes the walk's first puzzle. """
+        size = self.size
+        self.solution = random_grid(size, self.rng)
+        self.givens = self._minimal(self.rng.sample(range(size**2),
+                                                    size**2))
+        self.current = self._score(self.givens)
+        self.best = [self.current]
+
+
+    def _take_step(self):
+        """ helper function for run(). takes one step: adds a clue, then
+        tries to remove the others first, so the walk doesn't simply step
+        back to where it was. """
+        rng = self.rng
+        givens = self.givens
+        added = rng.choice([i for i in range(self.size**2)
+                            if i not in givens])
+        neighbor = self._minimal(rng.sample(givens, len(givens)) + [added])
+
+        entry = self._score(neighbor)
+        _keep_best(self.best, entry, self.top)
+        if entry[0] >= self.current[0]:
+            self.givens, self.current = neighbor, entry
+
+
+def solve_many(puzzles, workers=None, chunksize=16, ordered=True,
+               size=9, engine='backtrack', propagation=False,
+               cls=Sudoku, stats=False):
+    """ solves many puzzles across a pool of worker processes, and yields one
+    result per puzzle as a dict with keys:
+        index:          position of the puzzle in puzzles
+        solutions:      list of solutions found, as in Sudoku.solutions
+        difficulty:     as in Sudoku.difficulty
+        time:           seconds spent building and solving the puzzle
+        stats:          a SolveStats of the solve (see stats.py), only if
+                        stats is True; add them up with stats.total()
+    puzzles is any iterable of puzzle lists, as given to Sudoku(); it is
+    read lazily. With ordered=True results come back in input order;
+    otherwise they come back as soon as they are done. workers defaults to
+    the number of CPUs; with workers=1 no pool is started and puzzles are
+    solved in this process. chunksize is the number of puzzles handed to a
+    worker at a time; larger chunks cost less to ship but balance worse.
+    The remaining arguments are passed on to cls (Sudoku or BitmaskSudoku).
+    """
+    solve_one = partial(_solve_one, cls, size, engine, propagation, stats)
+    jobs = enumerate(puzzles)
+
+    if workers == 1:
+        for job in jobs:
+            yield solve_one(job)
+        return
+
+    # imported here so only callers that start a pool pay for it
+    import multiprocessing
+    with multiprocessing.Pool(workers) as pool:
+        if ordered:
+            yield from pool.imap(solve_one, jobs, chunksize)
+        else:
+            yield from pool.imap_unordered(solve_one, jobs, chunksize)
+
+
+def _solve_one(cls, size, engine, propagation, stats, job):
+    # helper function for solve_many(); runs in a worker process
+    index, given = job
+    solve_stats = SolveStats() if stats else None
+    t0 = time.perf_counter()
+    puzzle = cls(size=size, label=index, puzzle=given, engine=engine,
+                 propagation=propagation, stats=solve_stats)
+    t1 = time.perf_counter()
+    res = {'index': index,
+           'solutions': puzzle.solutions,
+           'difficulty': puzzle.difficulty,
+           'time': t1 - t0}
+    if stats:
+        res['stats'] = solve_stats
+    return res
+
+
 def _comparisons():
     dlbeer_55 = [5,3,4,0,0,8,0,1,0,
                  0,0,0,0,0,2,0,9,0,
@@ -654,119 +1787,212 @@ def _comparisons():
     print("Difficulty: ", puzzle.difficulty)
 
 
-def generate(base_puzzle=Sudoku(), steps=10, walks=1):
-    """ 
-    """
+def generate(count=1, difficulty=(0, math.inf), time_limit=None,
+             max_steps=None, size=9, engine='backtrack', propagation=False,
+             cls=Sudoku):
+    """ yields up to count new, uniquely solvable puzzles whose difficulty
+    (as computed by Sudoku.score()) is within the range difficulty, given as
+    (lowest, highest). Each is a solved and scored cls object, made with the
+    given size, engine, and propagation (see solve_many()).
 
-    # start with the first solution solve() gives as best found so far
-    print("puzzle state before solve():")
-    print(self)
-    self.solve(report=False)
-    puzzles_found = [(0, self.solutions[0])]
-
-    print("best puzzle found so far: ", puzzles_found[0][1])
-    print("best score so far: ", puzzles_found[0][0])
-
-    # make a copy of the best-so-far puzzle, where we'll start
-    puzzle = self.solutions[0][:]
-
-    # generate populations for later sampling; these are lists of indices
-    unsolved_cells = []
-    solved_cells = []
-    for i in range(len(puzzle)):
-        if isinstance(puzzle[i], int):
-            solved_cells.append(puzzle.index(puzzle[i], i))
-        else:
-            unsolved_cells.append(puzzle.index(puzzle[i], i))
-
-    print("unsolved cells initial: ")
-    print(unsolved_cells)
-
-    print("solved cells initial: ")
-    print(solved_cells)
-
-    for i in range(walks):
-        # take given number of walks
-        for j in range(steps):
-            """ take given number of steps per walk. A 'step' is adding or
-            removing two clues, where addition or removal is chosen
-            randomly but proportional to the options there are. e.g., if
-            the puzzle is entirely complete, it will choose to remove with
-            certainty; if it is almost complete, it will choose to remove
-            with near-certainty, etc. """
-            p = 1 - len(unsolved_cells)/len(puzzle)
-            
-            if np.random.random() < p:
-                # this step is a removal of clues
-                # pick two cells from solved calls
-                positions = (
-                    np.random.choice(solved_cells, 2, replace=False))
-                for index in positions:
-                    self.remove(index, puzzle)
-                    unsolved_cells.append(index)
-                    solved_cells.remove(index)
-            else:
-                # this step is an addition of clues
-                # pick two cells from unsolved cells
-                positions = (
-                    np.random.choice(unsolved_cells, 2, replace=False))
-                for index in positions:
-                    value = np.random.choice(list(puzzle[index]))
-                    self.insert(value, index, puzzle)
-                    solved_cells.append(index)
-                    unsolved_cells.remove(index)
-
-            # add puzzle so far to list, for later comparison
-            puzzles_found.append((np.NaN, puzzle[:]))
-
-        print(f"walk {i} complete")
-        print("puzzles found without scoring and tossing invalids:")
-        print(puzzles_found)
-        print("length: ", len(puzzles_found))
-            
-        # walk i complete
-        # check puzzles found so far and toss out invalid ones
-        for score, puzz in puzzles_found:
-            print("puzzle solved and scored:")
-            puzz_copy = puzz[:]
-            print("puzzle pre-solve:")
-            print(self.print(puzz_copy))
-            self.solve(puzz_copy, report=False)
-            score_copy = self.difficulty
-            print("puzzle post-solve:")
-            print(self.print(puzz_copy))
-            print("score: ", score_copy)
-##                if score_copy is np.NaN:
-##                    # puzz has no unique solution; toss it
-##                    puzzles_found.remove((score, puzz))
-##                else:
-##                    # puzz has a unique solution; update its score
-##                    puzzles_found.remove((score, puzz))
-##                    puzzles_found.append((score_copy, puzz))
-                
-
-##            print("puzzles found after tossing invalids:")
-##            print(puzzles_found)
-##            print("length: ", len(puzzles_found))
-        
-
-        """ remove everything from puzzles_found """
-
-##                self.solve(puzzle, report=False)
-##                if self.difficulty is not np.NaN:
-##                    # puzzle generated after this step is valid; store it
-##                    puzzles_found.append((self.difficulty, puzzle))
-        
+    Each puzzle starts as a random full grid. Clues are removed from it, in
+    random order, as long as the solution stays unique, which makes the
+    hardest puzzle that grid allows; if that is too hard, clues are added
+    back from the solution, one at a time, until it is easy enough. Only the
+    finished puzzle is solved and scored; see _remove_clues() for how
+    uniqueness is checked after each removal without a full solve.
 
+    Generation stops early once time_limit seconds have passed, or
+    max_steps clue removals have been tried, counted across all puzzles.
+    """
+    lowest, highest = difficulty
+    deadline = None if time_limit is None else (time.perf_counter()
+                                                + time_limit)
+    steps = 0
+
+    def in_budget():
+        # counts one removal; returns False once the budget is spent
+        nonlocal steps
+        if ((deadline is not None and time.perf_counter() >= deadline)
+            or (max_steps is not None and steps >= max_steps)):
+            return False
+        steps += 1
+        return True
 
-    print("all walks complete")
-    print("state of puzzle:")
-    print(self.print(puzzle))
+    made = 0
+    while made < count:
+        solution = random_grid(size)
+        order = random.sample(range(size**2), size**2)
+        givens = []
+        if not _remove_clues(sudoku_cover(size), size, solution, order,
+                             0, len(order), givens, in_budget):
+            return
 
-                
-    # final step: store best puzzle, store its solution and difficulty
-##        self.puzzle = best_puzzle
-##        self.solve(report=False)
+        # givens is now minimal; add clues back until easy enough
+        removed = [i for i in order if i not in givens]
+        while True:
+            puzzle = [0] * size**2
+            for i in givens:
+                puzzle[i] = solution[i]
+            sudoku = cls(size=size, label=f"generated {made}",
+                         puzzle=puzzle, engine=engine,
+                         propagation=propagation)
+            if sudoku.difficulty <= highest or not removed:
+                break
+            givens.append(removed.pop())
+
+        if lowest <= sudoku.difficulty <= highest:
+            made += 1
+            yield sudoku
+
+
+def generate_walks(walks=4, steps=100, top=10, workers=None, seed=None,
+                   size=9, engine='backtrack', propagation=False,
+                   cls=Sudoku):
+    """ searches for hard puzzles with independent random walks run across a
+    pool of worker processes, and returns the top distinct puzzles found, as
+    a list of (difficulty, puzzle) tuples, hardest first; each puzzle is a
+    tuple of ints, 0 for empty cells.
+
+    Each walk is a Walk of the given number of steps, and keeps its own top
+    best puzzles; these are merged into the overall top as walks finish, so
+    only top puzzles per walk are ever sent between processes. To
+    checkpoint or resume a long walk, run a Walk directly.
+
+    Walk n is seeded with seed and n, through its own random.Random, so the
+    same seed gives the same result whatever the number of workers; seed
+    defaults to a random one. workers is as in solve_many(), and the
+    remaining arguments are passed on to cls.
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    walk = partial(_walk, cls, size, engine, propagation, steps, top)
+    seeds = [f"{seed}:{n}" for n in range(walks)]
+
+    # min-heap of the best puzzles found so far, easiest at the top
+    best = []
+    if workers == 1:
+        for found in map(walk, seeds):
+            for entry in found:
+                _keep_best(best, entry, top)
+    else:
+        # imported here so only callers that start a pool pay for it
+        import multiprocessing
+        with multiprocessing.Pool(workers) as pool:
+            for found in pool.imap_unordered(walk, seeds):
+                for entry in found:
+                    _keep_best(best, entry, top)
+
+    return sorted(best, reverse=True)
+
+
+def _walk(cls, size, engine, propagation, steps, top, seed):
+    # helper function for generate_walks(); runs one walk (see Walk), in a
+    # worker process, and returns its top best (difficulty, puzzle) tuples
+    walk = Walk(seed, steps, top, size, engine, propagation, cls)
+    walk.run()
+    return walk.best
+
+
+def _keep_best(best, entry, top):
+    # helper function for generate_walks(); adds entry to the min-heap best
+    # if it is not already there and is among the top best
+    if entry in best:
+        return
+    if len(best) < top:
+        heapq.heappush(best, entry)
+    elif entry > best[0]:
+        heapq.heapreplace(best, entry)
+
+
+def random_grid(size=9, rng=random):
+    """ returns a random complete, valid grid of the given (perfect square)
+    size, as a list of ints, using rng (e.g. a random.Random).
+
+    Up to 16x16, the grid is found by a dlx search that tries rows in random
+    order and stops at the first solution; it is restarted, with a doubled
+    node budget, whenever it runs out of nodes. That search favors some
+    grids over others. Larger searches can take seconds, so above 16x16 the
+    grid is instead built directly from a pattern: each row is the one
+    above shifted by a box width, or by one more at the top of a band.
+    Either way a random transform (see symmetry.py) is then applied, which
+    only evens out the bias within an equivalence class: every grid
+    equivalent to the one found is equally likely, but the grids are not
+    uniform across classes, and above 16x16 they all come from the
+    pattern's class. """
+    if size > 16:
+        box_size = math.isqrt(size)
+        grid = [(box_size * (r % box_size) + r // box_size + c) % size + 1
+                for r in range(size) for c in range(size)]
+    else:
+        max_nodes = 2 * size**2
+        rows = None
+        while rows is None:
+            rows = sudoku_cover(size).sample(rng, max_nodes)
+            max_nodes *= 2
+
+        grid = [0] * size**2
+        for r in rows:
+            grid[r // size] = r % size + 1
+    return apply_transform(grid, random_transform(size, rng), size)
+
+
+def random_grids(count=None, size=9, rng=random):
+    """ yields count random grids from random_grid(), or never stops if count
+    is None; e.g., as a stream of solutions to make puzzles from. """
+    made = 0
+    while count is None or made < count:
+        yield random_grid(size, rng)
+        made += 1
+
+
+def _remove_clues(cover, size, solution, order, lo, hi, kept, in_budget,
+                  max_nodes=None):
+    """ helper function for generate(). Tries to remove the clues of cells
+    order[lo:hi] of the full grid solution, in order, keeping the solution
+    unique; appends the cells whose clue is needed to kept. Returns False if
+    in_budget() ran out first. If max_nodes is given, a clue whose count
+    takes more nodes than that is kept, as if it were needed; the puzzle
+    is still unique, but may not be minimal.
+
+    Since solution is known, the puzzle stays unique after a removal unless
+    some solution has another value in the cell just emptied; one dlx count
+    with that value excluded, stopped at the first solution, answers that.
+    On entry, cover has selected the clues of kept and of order[hi:], which
+    are the givens for every removal in this range except the clues of
+    order[lo:hi] themselves. The range is split in half: the first half is
+    tried with the second half's clues selected, then those are deselected
+    and the clues kept from the first half selected instead. Each clue is
+    thus selected O(log n) times, not once per removal.
+    """
+    if hi - lo == 1:
+        if not in_budget():
+            return False
+        index = order[lo]
+        row = index * size + solution[index] - 1
+        cover.exclude(row)
+        if cover.count(1, max_nodes) != 0:
+            # clue is needed for a unique solution, or may be
+            kept.append(index)
+        cover.include(row)
+        return True
 
+    mid = (lo + hi) // 2
+    rows = [i * size + solution[i] - 1 for i in order[mid:hi]]
+    for row in rows:
+        cover.select(row)
+    found = _remove_clues(cover, size, solution, order, lo, mid, kept,
+                          in_budget, max_nodes)
+    for row in reversed(rows):
+        cover.deselect(row)
+    if not found:
+        return False
 
-puzzle = Sudoku()
+    rows = [i * size + solution[i] - 1 for i in order[lo:mid] if i in kept]
+    for row in rows:
+        cover.select(row)
+    found = _remove_clues(cover, size, solution, order, mid, hi, kept,
+                          in_budget, max_nodes)
+    for row in reversed(rows):
+        cover.deselect(row)
+    return found
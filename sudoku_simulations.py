@@ -4,16 +4,10 @@ import turtle
 import random
 import math
 import time
+from propagation import RULES, propagate
 from simulator import simulate
-
-""" these global variables are used to track the performance of the various
-solve() functions. they must be initialized to zero by the caller to work!
-"""
-# counts recursions in solve fns
-recursions = 0
-# counts times None is returned in solve fns; roughly tracks failed branches
-failures = 0
-
+from stats import SolveStats
+from topology import SYMBOLS, VALUES, puzzle_topology
 
 """ todos:
         - rebuild fundamental data structure            DONE 19/08
@@ -25,7 +19,7 @@ failures = 0
         - pickle puzzles
         - removal algorithm - basic
         - removal algorithm - multiple difficulties
-        - generalize turtle fns for puzzles not 9x9
+        - generalize turtle fns for puzzles not 9x9     DONE 18/10
         - generalize initialize() and make() for size
         - implement GUI
             - fill cells
@@ -39,16 +33,18 @@ failures = 0
             - highlight selected number (every 8, e.g.)
 """
 
-# TODO: generalize for puzzles not 9x9 in size
+# draws the grid of a size x size puzzle, box_size being the width of a cell
 # postcondition: turtle t at origin, facing east, pen is up
-def draw_board(t, box_size):
+def draw_board(t, box_size, size=9):
     # initialize pen and draw first set of boxes
+    half = size / 2
+    thick = math.isqrt(size)
     t.pu()
-    t.goto(box_size * 4.5, box_size * 4.5)
+    t.goto(box_size * half, box_size * half)
     t.seth(180)
     t.pd()
-    for i in range(10):
-        if i % 3 == 0:
+    for i in range(size + 1):
+        if i % thick == 0:
             t.width(2)
         else:
             t.width(1)
@@ -56,13 +52,13 @@ def draw_board(t, box_size):
 
     # initialize pen and draw second set of boxes
     t.pu()
-    t.goto(box_size * -4.5, box_size * -4.5)
+    t.goto(box_size * -half, box_size * -half)
     t.lt(180)
     t.pd()
 
-    # range is only 9 because outermost box already drawn
-    for i in range(9):
-        if i % 3 == 0:
+    # range is only size because outermost box already drawn
+    for i in range(size):
+        if i % thick == 0:
             t.width(2)
         else:
             t.width(1)
@@ -105,22 +101,21 @@ def fewest_candidates(puzzle):
     return fewest
 
 
-# TO DO: generalize for puzzles not 9x9 in size
 # postcondition: all non-zero values filled into board, pen is up
 def fill_board(t, puzzle, box_size):
-    size = int(math.sqrt(len(puzzle)))
+    size = math.isqrt(len(puzzle))
 
     # initialize pen for cell (0, 0)
     t.pu()
-    t.goto(box_size * -4.5 + box_size * (1/2),
-            box_size * 3.5 + box_size * (1/4))
+    t.goto(box_size * -(size / 2) + box_size * (1/2),
+            box_size * (size / 2 - 1) + box_size * (1/4))
     t.pd()
 
     # fill boxes with elements from puzzle
     for i in range(len(puzzle)):
         if isinstance(puzzle[i], int):
             # cell has determinate value; print it
-            t.write(puzzle[i], move=False, align="center", 
+            t.write(SYMBOLS[puzzle[i] - 1], move=False, align="center", 
                     font=("Arial", int(box_size / 2.5), "normal"))
         elif len(puzzle[i]) == 0:
             i# cell has no candidates; puzzle is unsolvable; print error
@@ -144,15 +139,15 @@ def fill_board(t, puzzle, box_size):
     t.pu()
 
 
-# TO DO: generalize for puzzles not 9x9 in size
 # precondition: x and y be w/n range of grid
 # postcondition: cell (x, y) is has value or error marked, and pen is up
 def fill_cell(t, x, y, puzzle, box_size):
-    pen_to_cell(t, x, y, box_size)
-    i = int(math.sqrt(len(puzzle))) * x + y
+    size = math.isqrt(len(puzzle))
+    pen_to_cell(t, x, y, box_size, size)
+    i = size * x + y
     if isinstance(puzzle[i], int):
         # cell has determinate value; print it
-        t.write(puzzle[i], move=False, align="center", 
+        t.write(SYMBOLS[puzzle[i] - 1], move=False, align="center", 
                 font=("Arial", int(box_size / 2.5), "normal"))
     elif len(puzzle[i]) == 0:
         # cell has no candidates; puzzle is unsolvable; print error
@@ -181,22 +176,26 @@ def initialize(size=9):
     puzzle = []
     
     for i in range(size**2):
-        puzzle.append('123456789')
+        puzzle.append(SYMBOLS[:size])
         
     return puzzle
 
 
 """ Inserts value into given cell of given puzzle. Helper function for
-make_puzzle() and various solve() functions
+make_puzzle() and various solve() functions. If trail (a list) is given, the
+(index, old value) of every changed cell is appended to it, for undo().
 """
-def insert(value, index, puzzle):
-    size = int(math.sqrt(len(puzzle)))
-    row = index // size
-    col = index % size
-    rm_from_row(puzzle, row, value)
-    rm_from_col(puzzle, col, value)
-    rm_from_box(puzzle, row, col, value)
-    puzzle[index] = int(value)
+def insert(value, index, puzzle, trail=None):
+    for j in puzzle_topology(puzzle).peers[index]:
+        if isinstance(puzzle[j], int):
+            continue
+        if value in puzzle[j]:
+            if trail is not None:
+                trail.append((j, puzzle[j]))
+            puzzle[j] = puzzle[j].replace(value, '')
+    if trail is not None:
+        trail.append((index, puzzle[index]))
+    puzzle[index] = VALUES[value]
 
 
 """ checks whether any cells have not been solved. Cells with candidates
@@ -292,14 +291,13 @@ def make(puzzle=None, size=9):
     return puzzle
     
 
-# TO DO: generalize for puzzles not 9x9 in size
 # preconditions: x and y be within the range of the grid's row and columns
 # postcondition: turtle t is pen down in cell (x, y) of grid
-def pen_to_cell(t, x, y, box_size):
+def pen_to_cell(t, x, y, box_size, size=9):
     # initialize pen to cell (0, 0) of grid, facing east
     t.pu()
-    t.goto(box_size * -4.5 + box_size * (1/2), 
-            box_size * 3.5 + box_size * (1/4))
+    t.goto(box_size * -(size / 2) + box_size * (1/2), 
+            box_size * (size / 2 - 1) + box_size * (1/4))
     t.seth(0)
 
     # move pen to cell (x, y) of grid
@@ -314,21 +312,22 @@ def pen_to_cell(t, x, y, box_size):
 
 # prints puzzle in makeshift board in console, faster for debugging
 def print_puzzle(puzzle):
-    size = math.sqrt(len(puzzle))
-    box_size = math.sqrt(size)
+    size = math.isqrt(len(puzzle))
+    box_size = math.isqrt(size)
+    bar = '-' * (2 * (size + box_size) + 1)
     for i in range(len(puzzle)):
         row = i // size
         col = i % size
         if row % box_size == 0 and col == 0:
             # starting a new row; print horizontal bar
-            print('-------------------------')
+            print(bar)
         if col % box_size == 0:
             # entered a new box; print vertical bar
             print('|', end= ' ')
 
         if isinstance(puzzle[i], int):
             # cell has determinate value
-            print(puzzle[i], end= ' ')
+            print(SYMBOLS[puzzle[i] - 1], end= ' ')
         elif len(puzzle[i]) > 1:
             # cell has multiple candidates
             print("0", end=' ')
@@ -342,60 +341,40 @@ def print_puzzle(puzzle):
         if col == size - 1:
             # hit right edge of puzzle; move to next line
             print('|')
-    print('-------------------------')
-
-
-def run_simulations():
-    global recursions
-    global failures
-
-    print("Non-random start, non-random solve:")
-    recursions = 0
-    failures = 0
-    simulate(solve_nonrand, initialize())
-    print("Average recursions performed: " + str(recursions / 1000))
-    print("Average branch failures: " + str(failures / 1000))
-    print('')
-
-    print("Non-random start, random non-optimized solve:")
-    recursions = 0
-    failures = 0
-    simulate(solve_slow, initialize())
-    print("Average recursions performed: " + str(recursions / 1000))
-    print("Average branch failures: " + str(failures / 1000))
-    print('')
-
-    print("Non-random start, random optimized solve:")
-    recursions = 0
-    failures = 0
-    simulate(solve_fast, initialize())
-    print("Average recursions performed: " + str(recursions / 1000))
-    print("Average branch failures: " + str(failures / 1000))
-    print('')
-
-    print("Random start, non-random solve:")
-    recursions = 0
-    failures = 0
-    simulate(solve_nonrand, make())
-    print("Average recursions performed: " + str(recursions / 1000))
-    print("Average branch failures: " + str(failures / 1000))
-    print('')
-
-    print("Random start, random non-optimized solve:")
-    recursions = 0
-    failures = 0
-    simulate(solve_slow, make())
-    print("Average recursions performed: " + str(recursions / 1000))
-    print("Average branch failures: " + str(failures / 1000))
-    print('')
-
-    print("Random start, random optimized solve:")
-    recursions = 0
-    failures = 0
-    simulate(solve_fast, make())
-    print("Average recursions performed: " + str(recursions / 1000))
-    print("Average branch failures: " + str(failures / 1000))
-    print('')
+    print(bar)
+
+
+def run_simulations(num_sims=1000):
+    simulations = [
+        ("Non-random start, non-random solve:", solve_nonrand, initialize),
+        ("Non-random start, random non-optimized solve:", solve_slow,
+         initialize),
+        ("Non-random start, random optimized solve:", solve_fast, initialize),
+        ("Random start, non-random solve:", solve_nonrand, make),
+        ("Random start, random non-optimized solve:", solve_slow, make),
+        ("Random start, random optimized solve:", solve_fast, make),
+        ("Random start, random optimized solve without copies:",
+         solve_trail, make),
+        ("Random start, random optimized solve with propagation:",
+         solve_propagate, make),
+    ]
+
+    for title, fn, start in simulations:
+        print(title)
+        stats = SolveStats()
+        result = simulate(fn, start(), num_sims=num_sims, stats=stats)
+        # stats include the warmup calls
+        calls = result['warmup'] + result['runs']
+        print("Average nodes visited: " + str(stats.nodes / calls))
+        print("Average backtracks: " + str(stats.backtracks / calls))
+        print("Max depth: " + str(stats.max_depth))
+        print("Average fewest_candidates() time: "
+              f"{stats.time_ns['fewest_candidates'] / calls / 1e6:.4f} ms")
+        if fn is solve_propagate:
+            for rule in RULES:
+                print(f"Average {rule} eliminations: "
+                      f"{stats.eliminations[rule] / calls}")
+        print('')
 
     
 """ The following functions remove a given candidate from the candidate
@@ -405,53 +384,44 @@ IMPORTANT: It is best to never call these fns directly, but to use insert(),
 which will do so prior to placement of the value in the cell.
 """
 def rm_from_row(puzzle, row, candidate):
-    size = int(math.sqrt(len(puzzle)))
-    row_index = row * size
-    for i in range(0, size):
-        j = row_index + i
+    for j in puzzle_topology(puzzle).rows[row]:
         if isinstance(puzzle[j], int):
             continue
         if candidate in puzzle[j]:
             puzzle[j] = puzzle[j].replace(candidate, '')
 
 def rm_from_col(puzzle, col, candidate):
-    size = int(math.sqrt(len(puzzle)))
-    for i in range(0, size**2, size):
-        j = i + col
+    for j in puzzle_topology(puzzle).cols[col]:
         if isinstance(puzzle[j], int):
             continue
         if candidate in puzzle[j]:
             puzzle[j] = puzzle[j].replace(candidate, '')
 
 def rm_from_box(puzzle, row, col, candidate):
-    # row and col values for cell in top-left corner of relevant box
-    box_r = row - (row % 3)
-    box_c = col - (col % 3)
-    # cell in top-left corner of relevant box
-    top_left = box_r * int(math.sqrt(len(puzzle))) + box_c
-    # now traverse all cells in box
-    for i in range(0, 19, 9):
-        for j in range(top_left + i, top_left + i + 3):
-            if isinstance(puzzle[j], int):
-                continue
-            if candidate in puzzle[j]:
-                puzzle[j] = puzzle[j].replace(candidate, '')
+    topo = puzzle_topology(puzzle)
+    for j in topo.boxes[topo.box_of[row * topo.size + col]]:
+        if isinstance(puzzle[j], int):
+            continue
+        if candidate in puzzle[j]:
+            puzzle[j] = puzzle[j].replace(candidate, '')
 
 
-def solve_fast(puzzle):
+def solve_fast(puzzle, stats=None):
     """ solver function that utilizes backtracking, randomization, and
     optimization. returns solved puzzle object, or None if given puzzle is
-    unsolvable.
+    unsolvable. If stats, a SolveStats (see stats.py), is given, the search
+    is counted on it.
 
     the optimization is that, rather than traversing all cells in order (from
     0 to 80 in a 9x9 puzzle, for example), the main loop of this function picks
     the cell with the fewest candidates.
     """
-    global recursions
-    global failures
+    if stats is not None:
+        stats.enter(puzzle)
 
     while not is_complete(puzzle):
-        i = fewest_candidates(puzzle)
+        i = (fewest_candidates(puzzle) if stats is None else
+             stats.call('fewest_candidates', fewest_candidates, puzzle))
         # fewest_candidates() skips solved cells
         
         if len(puzzle[i]) == 1:
@@ -461,7 +431,6 @@ def solve_fast(puzzle):
             continue
         if len(puzzle[i]) == 0:
             # cell has no possible solutions; puzzle unsolvable
-            failures += 1
             return None
         if len(puzzle[i]) > 1:
             # cell has more than one candidate
@@ -473,29 +442,123 @@ def solve_fast(puzzle):
                     insert(candidate, i, puzzle_copy)
 
                     # recurse on copy
-                    recursions += 1
-                    puzzle_copy = solve_fast(puzzle_copy)
+                    if stats is not None:
+                        stats.branch(copied=True)
+                    puzzle_copy = solve_fast(puzzle_copy, stats)
+                    if stats is not None:
+                        stats.unbranch(puzzle_copy is not None)
                     if puzzle_copy:
                         # candidate works; make copy main puzzle
                         puzzle = puzzle_copy
                         return puzzle
                     # otherwise, candidate is bad; try the next one
-            failures += 1
             return None                                            
+    if stats is not None:
+        stats.solved(puzzle)
+    return puzzle
+
+
+def solve_propagate(puzzle, stats=None):
+    """ solve_fast() with constraint propagation: before each branch, naked
+    and hidden singles and pairs are applied until none of them makes
+    progress (see propagation.py). Eliminations made by each rule are
+    counted on stats, if given.
+    """
+    if stats is not None:
+        stats.enter(puzzle)
+
+    while not is_complete(puzzle):
+        i = (fewest_candidates(puzzle) if stats is None else
+             stats.call('fewest_candidates', fewest_candidates, puzzle))
+
+        if len(puzzle[i]) == 1:
+            insert(puzzle[i], i, puzzle)
+            continue
+        if len(puzzle[i]) == 0:
+            return None
+        if len(puzzle[i]) > 1:
+            # propagate first; if that solves cells, pick a cell again
+            made = dict.fromkeys(RULES, 0)
+            eliminated = propagate(puzzle, made)
+            if stats is not None:
+                stats.propagated(made)
+            if eliminated is None:
+                return None
+            if eliminated:
+                continue
+
+            candidates = random.sample(puzzle[i], len(puzzle[i]))
+            for candidate in candidates:
+                puzzle_copy = puzzle[:]
+                insert(candidate, i, puzzle_copy)
+
+                if stats is not None:
+                    stats.branch(copied=True)
+                puzzle_copy = solve_propagate(puzzle_copy, stats)
+                if stats is not None:
+                    stats.unbranch(puzzle_copy is not None)
+                if puzzle_copy:
+                    return puzzle_copy
+            return None
+    if stats is not None:
+        stats.solved(puzzle)
     return puzzle
 
 
+def solve_trail(puzzle, trail=None, stats=None):
+    """ solve_fast() without copies: the puzzle is changed in place, every
+    change insert() makes is recorded on trail, and a failed candidate is
+    reversed with undo() before the next is tried. returns a solved copy of
+    the puzzle, or None; the given puzzle is left partially solved.
+    """
+    if trail is None:
+        trail = []
+    if stats is not None:
+        stats.enter(puzzle)
+
+    while not is_complete(puzzle):
+        i = (fewest_candidates(puzzle) if stats is None else
+             stats.call('fewest_candidates', fewest_candidates, puzzle))
+
+        if len(puzzle[i]) == 1:
+            insert(puzzle[i], i, puzzle, trail)
+            continue
+        if len(puzzle[i]) == 0:
+            return None
+        if len(puzzle[i]) > 1:
+            candidates = random.sample(puzzle[i], len(puzzle[i]))
+            for candidate in candidates:
+                mark = len(trail)
+                insert(candidate, i, puzzle, trail)
+
+                if stats is not None:
+                    stats.branch()
+                solution = solve_trail(puzzle, trail, stats)
+                if stats is not None:
+                    stats.unbranch(solution is not None)
+                if solution:
+                    return solution
+                # candidate is bad; reverse it and try the next one
+                undo(puzzle, trail, mark)
+            return None
+    if stats is not None:
+        stats.solved(puzzle)
+    return puzzle[:]
+
+
 """ SUPERCEDED by solve_fast(). solver function that utilizes backtracking and
 randomization, but no optimization. returns solved puzzle object, or None if
 given puzzle is unsolvable.
 """
-def solve_slow(puzzle):
-    global recursions
-    global failures
+def solve_slow(puzzle, stats=None):
+    if stats is not None:
+        stats.enter(puzzle)
 
     size = len(puzzle)
     for i in range(size):
         if is_complete(puzzle):
+            if stats is not None:
+                stats.solved(puzzle)
             return puzzle
         if isinstance(puzzle[i], int):
             # cell has already been solved; move on
@@ -507,7 +570,6 @@ def solve_slow(puzzle):
             continue
         if len(puzzle[i]) == 0:
             # cell has no possible solutions; puzzle unsolvable
-            failures += 1
             return None
         if len(puzzle[i]) > 1:
             # cell has more than one candidate
@@ -519,15 +581,19 @@ def solve_slow(puzzle):
                     insert(candidate, i, puzzle_copy)
 
                     # recurse on copy
-                    recursions += 1
-                    puzzle_copy = solve_slow(puzzle_copy)
+                    if stats is not None:
+                        stats.branch(copied=True)
+                    puzzle_copy = solve_slow(puzzle_copy, stats)
+                    if stats is not None:
+                        stats.unbranch(puzzle_copy is not None)
                     if puzzle_copy:
                         # candidate works; make copy main puzzle
                         puzzle = puzzle_copy
                         return puzzle
                     # otherwise, candidate is bad; try the next one
-            failures += 1
             return None
+    if stats is not None:
+        stats.solved(puzzle)
     return puzzle
 
 
@@ -535,13 +601,15 @@ def solve_slow(puzzle):
 without randomization. returns solved puzzle object, or None if given puzzle is
 unsolvable.
 """
-def solve_nonrand(puzzle):
-    global recursions
-    global failures
+def solve_nonrand(puzzle, stats=None):
+    if stats is not None:
+        stats.enter(puzzle)
 
     size = len(puzzle)
     for i in range(size):
         if is_complete(puzzle):
+            if stats is not None:
+                stats.solved(puzzle)
             return puzzle
         if isinstance(puzzle[i], int):
             # cell has already been solved; move on
@@ -553,7 +621,6 @@ def solve_nonrand(puzzle):
             continue
         if len(puzzle[i]) == 0:
             # cell has no possible solutions; puzzle unsolvable
-            failures += 1
             return None
         if len(puzzle[i]) > 1:
             # cell has more than one candidate
@@ -564,46 +631,51 @@ def solve_nonrand(puzzle):
                     insert(candidate, i, puzzle_copy)
 
                     # recurse on copy
-                    recursions += 1
-                    puzzle_copy = solve_nonrand(puzzle_copy)
+                    if stats is not None:
+                        stats.branch(copied=True)
+                    puzzle_copy = solve_nonrand(puzzle_copy, stats)
+                    if stats is not None:
+                        stats.unbranch(puzzle_copy is not None)
                     if puzzle_copy:
                         # candidate works; make copy main puzzle
                         puzzle = puzzle_copy
                         return puzzle
                     # otherwise, candidate is bad; try the next one
-            failures += 1
             return None
+    if stats is not None:
+        stats.solved(puzzle)
     return puzzle
 
 
+""" reverses the changes recorded on trail by insert(), newest first, until
+only mark of them are left.
+"""
+def undo(puzzle, trail, mark=0):
+    while len(trail) > mark:
+        index, value = trail.pop()
+        puzzle[index] = value
+
+
 def used_in_row(puzzle, row, candidate):
-    size = int(math.sqrt(len(puzzle)))
-    row_index = row * size
-    for i in range(0, size):
-        j = row_index + i
-        if puzzle[j] == int(candidate):
+    value = VALUES[candidate]
+    for j in puzzle_topology(puzzle).rows[row]:
+        if puzzle[j] == value:
             return True
     return False
 
 def used_in_col(puzzle, col, candidate):
-    size = int(math.sqrt(len(puzzle)))
-    for i in range(0, size**2, size):
-        j = i + col
-        if puzzle[j] == int(candidate):
+    value = VALUES[candidate]
+    for j in puzzle_topology(puzzle).cols[col]:
+        if puzzle[j] == value:
             return True
     return False
 
 def used_in_box(puzzle, row, col, candidate):
-    # row and col values for cell in top-left corner of relevant box
-    box_r = row - (row % 3)
-    box_c = col - (col % 3)
-    # cell in top-left corner of relevant box
-    top_left = box_r * int(math.sqrt(len(puzzle))) + box_c
-    # now traverse all cells in box
-    for i in range(0, 19, 9):
-        for j in range(top_left + i, top_left + i + 3):
-            if puzzle[j] == int(candidate):
-                return True
+    value = VALUES[candidate]
+    topo = puzzle_topology(puzzle)
+    for j in topo.boxes[topo.box_of[row * topo.size + col]]:
+        if puzzle[j] == value:
+            return True
     return False
 
 
@@ -611,14 +683,14 @@ def used_in_box(puzzle, row, col, candidate):
 for cell at given index in puzzle.
 """
 def valid(candidate, index, puzzle):
-    size = int(math.sqrt(len(puzzle)))
-    row = index // size
-    col = index % size
-    return (not used_in_row(puzzle, row, candidate) and
-            not used_in_col(puzzle, col, candidate) and
-            not used_in_box(puzzle, row, col, candidate))
-
-run_simulations()
+    value = VALUES[candidate]
+    for j in puzzle_topology(puzzle).peers[index]:
+        if puzzle[j] == value:
+            return False
+    return True
+
+if __name__ == '__main__':
+    run_simulations()
 
 ##puzzle = make()
 ##puzzle = solve_fast(puzzle)
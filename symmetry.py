@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+
+import math
+import random
+
+
+""" Canonical forms of Sudoku puzzles under the validity-preserving
+symmetries: relabeling the digits, permuting the rows within a band and the
+bands themselves, permuting the columns within a stack and the stacks
+themselves, and transposing. Puzzles related by any of these are
+equivalent: they have the same number of solutions, and the solutions
+correspond one to one.
+
+A transform is a tuple (transpose, rows, cols, labels):
+    transpose   True if the puzzle is transposed first
+    rows        rows[k] is the (source) row that becomes row k
+    cols        cols[c] is the (source) column that becomes column c
+    labels      labels[v] is the digit that v becomes (labels[0] == 0)
+apply_transform() applies one, and restore() undoes it, e.g. to map the
+solution of a canonical puzzle back to the puzzle it came from.
+"""
+
+
+""" kinds of blocks of a column order; see _extend() """
+_CELL = 0
+_STACKS = 1
+
+
+def _extend(row, columns, blocks, labels, label, best, tag, i=0,
+            values=None):
+    # helper function; extends best, a list [values, results], with the
+    # smallest that the given row (its values by source column) can become
+    # under the column orders that blocks allows and the given labels, and
+    # the ways it does, as tuples (tag, blocks, labels, next label), for the
+    # rows to come. Prefixes larger than the best so far are cut off.
+    # blocks is a tuple of blocks, in column order, each (_CELL, cols), for
+    # columns of one stack in any order, or (_STACKS, members), for whole
+    # stacks in any order, each a tuple of cells in order; the row is
+    # placed up to block i, as values. labels[v] is the label of digit v, 0
+    # if not met yet, or (col, shift) if v went into a block of new digits
+    # that was left in any order: its label is then shift plus the position
+    # that col takes. columns holds the contents of each source column
+    if values is None:
+        values = []
+    n = len(values)
+    infinity = len(labels)
+
+    # columns already in order need no branching
+    new_labels = labels
+    while i < len(blocks):
+        kind, items = blocks[i]
+        if kind != _CELL or len(items) > 1:
+            break
+        v = row[items[0]]
+        x = new_labels[v]
+        if isinstance(x, tuple):
+            index, position = _locate(blocks, x[0])
+            kind, cols = blocks[index]
+            if kind != _CELL or len(cols) > 1:
+                break
+            x = x[1] + position
+        elif v and not x:
+            if new_labels is labels:
+                new_labels = labels[:]
+            new_labels[v] = x = label
+            label += 1
+        values.append(x)
+        i += 1
+    labels = new_labels
+
+    if best[0] is not None:
+        prefix = best[0][:len(values)]
+        if values > prefix:
+            del values[n:]
+            return
+        if values < prefix:
+            best[:] = [None, []]
+    if i == len(blocks):
+        if best[0] is None:
+            best[0] = values[:]
+        best[1].append((tag, blocks, labels, label))
+        del values[n:]
+        return
+
+    def value(j):
+        # the value of column j, or the smallest it can take, as a tuple
+        # (value, kind), kind 0 if known, 1 if not placed yet, or 2 if new
+        v = row[j]
+        x = labels[v]
+        if isinstance(x, tuple):
+            index, position = _locate(blocks, x[0])
+            kind, cols = blocks[index]
+            if kind == _CELL and len(cols) == 1:
+                return x[1] + position, 0
+            if index == i and kind == _CELL and x[0] != j:
+                # with column j first in the same cell, x[0] comes second
+                position += 1
+            return x[1] + position, 1
+        if v and not x:
+            return infinity, 2
+        return x, 0
+
+    """ branches, as tuples (values, blocks, next block, labels, next
+    label) """
+    branches = []
+    kind, items = blocks[i]
+    if kind == _CELL:
+        found = {j: value(j) for j in items}
+        low, low_kind = min(found.values())
+        if low_kind == 0:
+            # the columns with the smallest known value go first, together
+            part = tuple(j for j in items if found[j] == (low, 0))
+            branches.append(([low] * len(part), _split(blocks, i, [part]),
+                             i + 1, labels, label))
+        elif low_kind == 1:
+            """ a column whose digit's label depends on where another
+            column goes; that one goes first where it can """
+            for j in items:
+                if found[j] != (low, 1):
+                    continue
+                col = labels[row[j]][0]
+                index = _locate(blocks, col)[0]
+                if col == j:
+                    new_blocks = _split(blocks, i, [(j,)])
+                    next_block = i + 1
+                elif index == i:
+                    new_blocks = _split(blocks, i, [(j,), (col,)])
+                    next_block = i + 1
+                else:
+                    new_blocks, count = _place(blocks, index, col)
+                    next_block = i + count - 1 if index < i else i
+                    new_blocks = _split(new_blocks, next_block, [(j,)])
+                    next_block += 1
+                branches.append(([low], new_blocks, next_block, labels,
+                                 label))
+        elif len({row[j] for j in items}) == len(items):
+            # new digits, all different; they may stay in any order
+            new_labels = labels[:]
+            for j in items:
+                new_labels[row[j]] = (j, label - len(values))
+            branches.append((list(range(label, label + len(items))),
+                             blocks, i + 1, new_labels, label + len(items)))
+        else:
+            # every value is new; each digit may take the next label
+            for v in sorted({row[j] for j in items}):
+                new_labels = labels[:]
+                new_labels[v] = label
+                part = tuple(j for j in items if row[j] == v)
+                branches.append(([label] * len(part),
+                                 _split(blocks, i, [part]), i + 1,
+                                 new_labels, label + 1))
+    else:
+        found = {j: value(j) for member in items for cell in member
+                 for j in cell}
+        # the smallest each member's values can be, new ones as infinity
+        keys = [sum((sorted(found[j][0] for j in cell) for cell in member),
+                    []) for member in items]
+        low = min(keys)
+        kinds = {k for x, k in found.values()}
+        digits = {row[j] for j in found}
+        exact = [all(found[j][1] == 0 for cell in member for j in cell)
+                 for member in items]
+        if kinds == {2} and len(digits) == len(found):
+            # new digits, all different; the stacks may stay in any order
+            new_labels = labels[:]
+            for j in found:
+                new_labels[row[j]] = (j, label - len(values))
+            branches.append((list(range(label, label + len(found))),
+                             blocks, i + 1, new_labels, label + len(found)))
+        elif any(k == low and exact[m] for m, k in enumerate(keys)):
+            """ stacks whose values are known and tie stay in any order,
+            each split by value into cells """
+            group = tuple(tuple(tuple(j for j in cell if found[j][0] == x)
+                                for cell in member
+                                for x in sorted({found[j][0]
+                                                 for j in cell}))
+                          for member, k in zip(items, keys) if k == low)
+            others = tuple(member for member, k in zip(items, keys)
+                           if k != low)
+            if len(group) > 1:
+                placed = ((_STACKS, group),)
+            else:
+                placed = tuple((_CELL, cell) for cell in group[0])
+            if others:
+                placed += ((_STACKS, others),)
+            branches.append((low * len(group),
+                             blocks[:i] + placed + blocks[i + 1:],
+                             i + len(placed) - bool(others), labels, label))
+        else:
+            """ stacks with new values, or values that depend on where
+            other columns go; each may go next, one of each content. With
+            new values only, just those that can be smallest """
+            seen = set()
+            for m, member in enumerate(items):
+                content = tuple(tuple(sorted(columns[j] for j in cell))
+                                for cell in member)
+                if (1 not in kinds and keys[m] != low) or content in seen:
+                    continue
+                seen.add(content)
+                others = items[:m] + items[m + 1:]
+                placed = tuple((_CELL, cell) for cell in member)
+                if others:
+                    placed += ((_STACKS, others),)
+                branches.append(([], blocks[:i] + placed + blocks[i + 1:],
+                                 i, labels, label))
+
+    for new_values, new_blocks, next_block, new_labels, new_label \
+            in branches:
+        values += new_values
+        _extend(row, columns, new_blocks, new_labels, new_label, best, tag,
+                next_block, values)
+        del values[len(values) - len(new_values):]
+    del values[n:]
+
+
+def _split(blocks, index, parts):
+    # helper function; returns blocks with the cell at index split into the
+    # given parts, in order, then the rest of its columns
+    rest = tuple(j for j in blocks[index][1]
+                 if not any(j in part for part in parts))
+    if rest:
+        parts = parts + [rest]
+    return (blocks[:index] + tuple((_CELL, part) for part in parts)
+            + blocks[index + 1:])
+
+
+def _locate(blocks, col):
+    # helper function; returns (index, position): the index of the block
+    # that holds the given column, and the first position it can take
+    start = 0
+    for index, (kind, items) in enumerate(blocks):
+        if kind == _CELL:
+            if col in items:
+                return index, start
+            start += len(items)
+        else:
+            for member in items:
+                offset = 0
+                for cell in member:
+                    if col in cell:
+                        return index, start + offset
+                    offset += len(cell)
+            start += offset * len(items)
+    raise ValueError(f"column {col} is not in {blocks}")
+
+
+def _place(blocks, index, col):
+    # helper function; returns (blocks, count): blocks with the given
+    # column first where it can go in the block at index, which becomes
+    # count blocks
+    kind, items = blocks[index]
+    if kind == _CELL:
+        new = ((_CELL, (col,)),
+               (_CELL, tuple(j for j in items if j != col)))
+    else:
+        member = next(member for member in items
+                      if any(col in cell for cell in member))
+        new = ()
+        for cell in member:
+            if col in cell and len(cell) > 1:
+                new += ((_CELL, (col,)),
+                        (_CELL, tuple(j for j in cell if j != col)))
+            else:
+                new += ((_CELL, cell),)
+        others = tuple(m for m in items if m != member)
+        if others:
+            new += ((_STACKS, others),)
+    return blocks[:index] + new + blocks[index + 1:], len(new)
+
+
+def random_transform(size=9, rng=random):
+    """ returns a transform chosen uniformly at random from every transform
+    of puzzles of the given size (of any perfect-square size), using rng,
+    e.g. a random.Random. """
+    box_size = int(math.sqrt(size))
+    orders = []
+    for axis in range(2):
+        order = []
+        for band in rng.sample(range(box_size), box_size):
+            order += rng.sample(range(band * box_size,
+                                      (band + 1) * box_size), box_size)
+        orders.append(order)
+    labels = [0] + rng.sample(range(1, size + 1), size)
+    return (rng.random() < 0.5, orders[0], orders[1], labels)
+
+
+def apply_transform(puzzle, transform, size=9):
+    """ returns the puzzle (a list of ints, 0 for empty cells) with the given
+    transform applied. """
+    transpose, rows, cols, labels = transform
+    res = []
+    for k in range(size):
+        for c in range(size):
+            if transpose:
+                res.append(labels[puzzle[cols[c] * size + rows[k]]])
+            else:
+                res.append(labels[puzzle[rows[k] * size + cols[c]]])
+    return res
+
+
+def restore(puzzle, transform, size=9):
+    """ returns the puzzle that apply_transform(res, transform) would turn
+    into the given puzzle; i.e., undoes the transform. """
+    transpose, rows, cols, labels = transform
+    unlabel = [0] * len(labels)
+    for v in range(len(labels)):
+        unlabel[labels[v]] = v
+
+    res = [0] * size**2
+    for k in range(size):
+        for c in range(size):
+            if transpose:
+                res[cols[c] * size + rows[k]] = unlabel[puzzle[k * size + c]]
+            else:
+                res[rows[k] * size + cols[c]] = unlabel[puzzle[k * size + c]]
+    return res
+
+
+def canonical_form(puzzle, size=9):
+    """ returns (canonical, transform): the canonical form of the given
+    puzzle (a list of ints, 0 for empty cells) and a transform that turns
+    puzzle into it. Equivalent puzzles have the same canonical form.
+
+    The canonical form is the transformed puzzle that is lexicographically
+    smallest, row by row, once its digits are relabeled in order of first
+    appearance. It is found row by row: every partial transform that gives
+    the smallest first k rows is kept, and only those are extended to row
+    k + 1. Rows (and bands) with identical contents are interchangeable, so
+    only one of each is tried; this keeps near-empty puzzles fast. Column
+    orders are not tried one by one: columns (and stacks) stay grouped
+    until a row tells them apart, and new digits met in a group take their
+    labels from where its columns end up, once a later row needs them (see
+    _extend()). A full grid no longer means trying every column order.
+
+    Only sizes up to 16x16 are supported (see topology.MAX_SIZE); larger
+    puzzles raise ValueError, since highly symmetric ones keep too many
+    row orders to search. Even at 16x16 a full grid with many symmetries
+    can take seconds, though puzzles take milliseconds.
+    """
+    box_size = int(math.sqrt(size))
+    if size > 16:
+        raise ValueError("canonical forms are only supported up to 16x16")
+
+    grids = (puzzle, [puzzle[c * size + r] for r in range(size)
+                      for c in range(size)])
+    columns = [[tuple(grid[c::size]) for c in range(size)] for grid in grids]
+
+    """ partial transforms, as lists [transpose, rows, blocks, labels, next]:
+    the source rows chosen so far, the column order (see _extend()), the
+    labels assigned so far (0 for digits not met yet), and the next label
+    to assign """
+    stacks = tuple((tuple(range(s * box_size, (s + 1) * box_size)),)
+                   for s in range(size // box_size))
+    states = [[t, [], ((_STACKS, stacks),), [0] * (size + 1), 1]
+              for t in (0, 1)]
+
+    for k in range(size):
+        best = [None, []]
+        for transpose, rows, blocks, labels, label in states:
+            grid = grids[transpose]
+            if k % box_size == 0:
+                # start of a band; any band not used yet
+                used = {r // box_size for r in rows}
+                bands = [b for b in range(size // box_size) if b not in used]
+            else:
+                bands = [rows[-1] // box_size]
+
+            seen = set()
+            for b in bands:
+                for r in range(b * box_size, (b + 1) * box_size):
+                    if r in rows:
+                        continue
+                    """ a row is interchangeable with another of the same
+                    contents in the same band; and at the start of a band,
+                    with the same row of a band of the same contents """
+                    content = tuple(grid[r * size:(r + 1) * size])
+                    if k % box_size == 0:
+                        key = (tuple(grid[b * box_size * size:
+                                          (b + 1) * box_size * size]),
+                               content)
+                    else:
+                        key = content
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    _extend(content, columns[transpose], blocks, labels,
+                            label, best, (transpose, rows + [r]))
+        states = [[transpose, rows, blocks, labels, label]
+                  for (transpose, rows), blocks, labels, label in best[1]]
+
+    transpose, rows, blocks, labels, label = states[0]
+    # columns still interchangeable may go in any order
+    cols = []
+    for kind, items in blocks:
+        if kind == _CELL:
+            cols += items
+        else:
+            for member in items:
+                for cell in member:
+                    cols += cell
+
+    labels = [x[1] + cols.index(x[0]) if isinstance(x, tuple) else x
+              for x in labels]
+    # digits not in the puzzle take the remaining labels in order
+    for v in range(1, size + 1):
+        if not labels[v]:
+            labels[v] = label
+            label += 1
+
+    transform = (bool(transpose), rows, list(cols), labels)
+    return apply_transform(puzzle, transform, size), transform
+
+
+def dedupe(puzzles, size=9):
+    """ yields each puzzle of the iterable puzzles that is not equivalent to
+    one yielded before it. Only canonical forms are kept in memory. """
+    seen = set()
+    for puzzle in puzzles:
+        canonical = tuple(canonical_form(puzzle, size)[0])
+        if canonical not in seen:
+            seen.add(canonical)
+            yield puzzle
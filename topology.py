@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+import math
+
+
+""" one character per value, used for candidate strings and in puzzle files:
+SYMBOLS[v - 1] stands for value v. The digits come first, so 9x9 puzzles
+read as usual, then letters, so values past 9 still take one character
+each (e.g., '10' would otherwise clash with the candidates '1' and '0');
+enough for box sizes up to 7. VALUES maps each character back to its value.
+"""
+SYMBOLS = '123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+VALUES = {symbol: v for v, symbol in enumerate(SYMBOLS, 1)}
+
+
+""" largest supported puzzle size: box sizes 2 through 4. Larger puzzles
+would fit SYMBOLS, but making one takes from seconds (25x25) to minutes
+(36x36), and their canonical forms can't always be found, so they are
+rejected rather than half supported. """
+MAX_SIZE = 16
+
+
+""" cache of Topology objects by size, so that every puzzle of a given size
+shares one set of index tables. Use topology() rather than reading this
+directly.
+"""
+_topologies = {}
+# same cache, keyed by number of cells (size**2) rather than size
+_topologies_by_cells = {}
+
+
+class Topology:
+    """ represents the row, column, and box structure of a Sudoku puzzle of a
+    given size, precomputed as index tables.
+
+    A puzzle is a flat list of size**2 cells in row-major order, so every
+    set (row, column, or box) is a list of indices into it. Building these
+    once per size saves the solvers from re-deriving them with //, %, and
+    math.sqrt() every time a value is inserted or a set is scanned.
+    """
+
+    def __init__(self, size=9):
+        self.size = size
+        self.box_size = math.isqrt(size)
+        if self.box_size**2 != size or not 1 < size <= MAX_SIZE:
+            raise ValueError(f"puzzle size must be a perfect square from 4 "
+                             f"to {MAX_SIZE}, not {size!r}")
+        self.cells = size**2
+
+        """ index lists of every row, column, and box. Rows and columns are
+        ordered top to bottom and left to right; boxes are ordered like
+        rows, and the cells within each box are in row-major order. """
+        self.rows = [list(range(row * size, (row + 1) * size))
+                     for row in range(size)]
+        self.cols = [list(range(col, self.cells, size))
+                     for col in range(size)]
+        self.boxes = []
+        for box_r in range(0, size, self.box_size):
+            for box_c in range(0, size, self.box_size):
+                top_left = box_r * size + box_c
+                self.boxes.append([top_left + r * size + c
+                                   for r in range(self.box_size)
+                                   for c in range(self.box_size)])
+
+        """ every unit (set) of the puzzle: columns, then rows, then boxes,
+        which is the order Sudoku.fewest_positions() scans them in """
+        self.units = self.cols + self.rows + self.boxes
+
+        # row, column, and box number of every cell
+        self.row_of = [i // size for i in range(self.cells)]
+        self.col_of = [i % size for i in range(self.cells)]
+        self.box_of = [(self.row_of[i] // self.box_size) * self.box_size
+                       + self.col_of[i] // self.box_size
+                       for i in range(self.cells)]
+
+        # the three units containing every cell, as indices into self.units
+        self.units_of = [(self.col_of[i],
+                          size + self.row_of[i],
+                          2 * size + self.box_of[i])
+                         for i in range(self.cells)]
+
+        """ peers of every cell: the cells sharing its row, column, or box,
+        excluding the cell itself (20 per cell in a 9x9 puzzle) """
+        self.peers = []
+        for i in range(self.cells):
+            peers = set(self.rows[self.row_of[i]])
+            peers.update(self.cols[self.col_of[i]])
+            peers.update(self.boxes[self.box_of[i]])
+            peers.discard(i)
+            self.peers.append(sorted(peers))
+
+
+def topology(size=9):
+    """ returns the shared Topology for puzzles of the given size, building it
+    on first use. """
+    if size not in _topologies:
+        topo = Topology(size)
+        _topologies[size] = topo
+        _topologies_by_cells[topo.cells] = topo
+    return _topologies[size]
+
+
+def puzzle_topology(puzzle):
+    """ returns the shared Topology for the given puzzle list, looked up by
+    its number of cells. """
+    try:
+        return _topologies_by_cells[len(puzzle)]
+    except KeyError:
+        return topology(math.isqrt(len(puzzle)))